@@ -0,0 +1,150 @@
+"""
+Admission control for the API: sheds load before it exhausts the worker
+"""
+import os
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+import config
+import metrics
+
+# /proc/self/statm counts pages, which are larger than 4 KB on some kernels (e.g. 16 KB or 64 KB on arm64)
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def resident_memory_mb() -> Optional[float]:
+    """
+    Resident set size of this process in MB
+
+    Returns:
+        RSS in MB, or None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * PAGE_SIZE / 1024 / 1024
+
+
+class Admission:
+    """
+    Slot of an admitted request in its endpoint group's budget
+
+    Released when its with block ends or by release(), whichever comes first.
+    """
+
+    def __init__(self, controller: "AdmissionController", group: str):
+        self.controller = controller
+        self.group = group
+        self.released = False
+
+    def release(self):
+        """Give the slot back (only the first call does anything)"""
+        if not self.released:
+            self.released = True
+            self.controller.outstanding[self.group] -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Rejects requests when an endpoint group is over its budget or memory is short
+
+    Every group has a budget of outstanding requests (running or queued). A request
+    beyond it gets 429. Any request arriving while the process uses more than
+    max_rss_mb gets 503. Both carry a Retry-After header.
+    """
+
+    def __init__(self, budgets: Dict[str, int], max_rss_mb: float = config.ADMISSION_MAX_RSS_MB,
+                 retry_after: int = config.ADMISSION_RETRY_AFTER):
+        """
+        Initialize controller
+
+        Args:
+            budgets: Maximum outstanding requests of each endpoint group (0 = unlimited)
+            max_rss_mb: Resident memory above which requests are rejected (0 = no limit)
+            retry_after: Seconds clients are asked to wait before retrying
+        """
+        self.budgets = budgets
+        self.max_rss_mb = max_rss_mb
+        self.retry_after = retry_after
+        self.outstanding = {group: 0 for group in budgets}
+
+    def check(self, group: str):
+        """
+        Raise an HTTPException if a request of the group can't be accepted now
+
+        Args:
+            group: Endpoint group
+        """
+        budget = self.budgets[group]
+        if budget and self.outstanding[group] >= budget:
+            self._reject(group, 429, "queue_full", f"Too many {group} requests in progress, retry later")
+
+        if self.max_rss_mb:
+            rss = resident_memory_mb()
+            if rss is not None and rss > self.max_rss_mb:
+                self._reject(group, 503, "memory", "Server is low on memory, retry later")
+
+    def _reject(self, group: str, status_code: int, reason: str, detail: str):
+        metrics.ADMISSION_REJECTED.inc(group=group, reason=reason)
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+    def admit(self, group: str) -> Admission:
+        """
+        Check a request like check() and take a slot for it in the same step
+
+        Nothing runs between the check and taking the slot, so concurrent requests
+        can't all pass the check before any of them is counted. Hold the slot for as
+        long as the request does work, e.g. `with controller.admit("batch"):`.
+
+        Args:
+            group: Endpoint group
+
+        Returns:
+            The request's slot
+        """
+        self.check(group)
+        self.outstanding[group] += 1
+        return Admission(self, group)
+
+    @contextmanager
+    def track(self, group: str):
+        """
+        Count a request that passed check() as outstanding for the duration of a with block
+
+        Args:
+            group: Endpoint group
+        """
+        self.outstanding[group] += 1
+        try:
+            yield
+        finally:
+            self.outstanding[group] -= 1
+
+    def queue_depth(self) -> Dict:
+        """
+        Get outstanding requests per group
+
+        Returns:
+            Dictionary with the outstanding count and budget of each group
+        """
+        return {
+            group: {"outstanding": self.outstanding[group], "budget": budget}
+            for group, budget in self.budgets.items()
+        }
+
+
+controller = AdmissionController({
+    "single": config.ADMISSION_MAX_SINGLE,
+    "batch": config.ADMISSION_MAX_BATCH,
+    "explain": config.ADMISSION_MAX_EXPLAIN
+})
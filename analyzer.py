@@ -2,23 +2,29 @@
 Advanced Sentiment Analysis Engine with Multiple Models
 """
 import os
+import threading
+import time
+from pathlib import Path
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
+from collections import Counter, OrderedDict
 import spacy
 from spacy.pipeline import Sentencizer
 import warnings
 warnings.filterwarnings('ignore')
 
 # Import existing modules
-from preprocess import preprocess, construct_spacy_obj
+from preprocess import preprocess, preprocess_texts, construct_spacy_obj, preprocess_and_parse, deduplicate_reviews
 import ft
 import train
-from feature_extraction import feature_extraction
-from classifiation import classify
+from feature_extraction import count_nouns, features_from_counts
+from classifiation import classify, categorize_sentences, predict_sentences, features_in_reviews, expand_duplicates
 
 # Import config
 import config
+import metrics
+from prediction_cache import PredictionCache
 
 # For Hugging Face Transformers
 try:
@@ -52,6 +58,67 @@ except ImportError:
     print("LIME not available. Install with: pip install lime")
 
 
+# Reviews run through every stage by SentimentAnalyzer.warmup()
+WARMUP_REVIEWS = [
+    "This phone has an amazing camera! Battery life is great too.",
+    "The battery drains too fast and the screen scratches easily.",
+    "Good value for money, but the speakers are a bit quiet.",
+    "Terrible customer service. The charger stopped working after a week."
+]
+
+
+# Texts LIME scores between two deadline checks
+LIME_DEADLINE_CHECK_EVERY = 250
+
+
+def deadline_passed(deadline: Optional[float]) -> bool:
+    """
+    Check whether a deadline has passed
+    
+    Args:
+        deadline: time.time() by which to stop, or None for no deadline
+        
+    Returns:
+        True once the deadline has passed
+    """
+    return deadline is not None and time.time() >= deadline
+
+
+class DeadlineExceeded(Exception):
+    """Raised inside a stage that ran out of time, carrying what it had done so far"""
+    
+    def __init__(self, done):
+        super().__init__("Deadline exceeded")
+        self.done = done
+
+
+def load_spacy_pipeline(model_name: Optional[str] = None, components: Optional[List[str]] = None):
+    """
+    Load a spaCy model with only the components the analysis uses
+    
+    Args:
+        model_name: Installed package name or path (defaults to config.SPACY_MODEL)
+        components: Components to keep (defaults to config.SPACY_COMPONENTS)
+        
+    Returns:
+        spaCy Language object without the excluded components
+    """
+    model_name = model_name or config.SPACY_MODEL
+    if components is None:
+        components = config.SPACY_COMPONENTS
+    
+    if spacy.util.is_package(model_name):
+        model_path = spacy.util.get_package_path(model_name)
+    else:
+        model_path = Path(model_name)
+    
+    # Raises OSError when the model is not installed
+    meta = spacy.util.get_model_meta(model_path)
+    exclude = [name for name in meta.get("components", meta.get("pipeline", [])) if name not in components]
+    
+    return spacy.load(model_name, exclude=exclude)
+
+
 class SentimentAnalyzer:
     """
     Comprehensive sentiment analysis engine with multiple model support
@@ -69,11 +136,12 @@ class SentimentAnalyzer:
         # Load Spacy model
         # Note: Model should be installed via requirements.txt for Streamlit Cloud
         try:
-            self.nlp = spacy.load('en_core_web_sm')
+            with metrics.model_load_timer("spacy"):
+                self.nlp = load_spacy_pipeline()
         except OSError as e:
             # If model is still not found, provide helpful error message
             error_msg = (
-                f"spaCy model 'en_core_web_sm' not found. "
+                f"spaCy model '{config.SPACY_MODEL}' not found. "
                 f"Please ensure it's installed via requirements.txt. "
                 f"Error: {str(e)}"
             )
@@ -83,10 +151,19 @@ class SentimentAnalyzer:
             self.nlp.add_pipe('sentencizer', last=True)
         
         # Load FastText model
-        self.ft_model = ft.get_model()
+        with metrics.model_load_timer("fasttext"):
+            self.ft_model = ft.get_model()
         
         # Load or train custom model
-        self.custom_model = train.get_model(self.nlp, self.ft_model)
+        with metrics.model_load_timer("logistic_regression"):
+            self.custom_model = train.get_model(self.nlp, self.ft_model)
+        
+        # Load the aspect taxonomy built from the training corpus (None if unavailable)
+        with metrics.model_load_timer("taxonomy"):
+            self.taxonomy = train.get_taxonomy(self.nlp, self.ft_model)
+        
+        # Cache of sentence predictions, cleared whenever another model is used for them
+        self.prediction_cache = PredictionCache() if config.ENABLE_CACHING else None
         
         # Load Hugging Face model if requested
         self.transformers_pipeline = None
@@ -97,15 +174,60 @@ class SentimentAnalyzer:
         self.lime_explainer = None
         if LIME_AVAILABLE:
             self.lime_explainer = LimeTextExplainer(class_names=["Negative", "Positive"])
+        
+        self.warmed_up = False
+    
+    def warmup(self) -> float:
+        """
+        Run a few representative reviews through every analysis stage
+        
+        Loads what the models initialize lazily (language profiles, vocabulary
+        and vector lookups, the prediction cache) so the first real requests don't
+        pay for it. Does nothing once the analyzer is warm.
+        
+        Returns:
+            Seconds taken
+        """
+        if self.warmed_up:
+            return 0.0
+        
+        start = time.perf_counter()
+        self.analyze_single_review(WARMUP_REVIEWS[0])
+        self.analyze_texts(WARMUP_REVIEWS)
+        self.analyze_batch(pd.DataFrame({
+            'reviewText': WARMUP_REVIEWS,
+            'rating': [5, 2, 4, 1]
+        }))
+        if self.transformers_pipeline:
+            self._predict_with_transformers(WARMUP_REVIEWS[0])
+        
+        self.warmed_up = True
+        return time.perf_counter() - start
+    
+    def models_loaded(self) -> Dict:
+        """
+        Get which models this analyzer has loaded
+        
+        Returns:
+            Dictionary of model name to whether it is loaded
+        """
+        return {
+            "spacy": self.nlp is not None,
+            "fasttext": self.ft_model is not None,
+            "logistic_regression": self.custom_model is not None,
+            "taxonomy": self.taxonomy is not None,
+            "transformers": self.transformers_pipeline is not None
+        }
     
     def _load_transformers_model(self):
         """Load Hugging Face transformers model"""
         try:
-            self.transformers_pipeline = pipeline(
-                "sentiment-analysis",
-                model=config.TRANSFORMERS_MODEL_NAME,
-                return_all_scores=True
-            )
+            with metrics.model_load_timer("transformers"):
+                self.transformers_pipeline = pipeline(
+                    "sentiment-analysis",
+                    model=config.TRANSFORMERS_MODEL_NAME,
+                    return_all_scores=True
+                )
             print(f"Loaded transformers model: {config.TRANSFORMERS_MODEL_NAME}")
         except Exception as e:
             print(f"Error loading transformers model: {e}")
@@ -149,7 +271,8 @@ class SentimentAnalyzer:
         
         # Preprocess
         from preprocess import preprocess_text
-        processed_text = preprocess_text(text, self.nlp)
+        with metrics.stage_timer("preprocess"):
+            processed_text = preprocess_text(text, self.nlp)
         
         if pd.isna(processed_text) or not processed_text:
             return {
@@ -164,10 +287,11 @@ class SentimentAnalyzer:
         })
         
         # Construct Spacy objects
-        df = construct_spacy_obj(df, self.nlp)
+        with metrics.stage_timer("parse"):
+            df = construct_spacy_obj(df, self.nlp)
         
         # Extract features
-        features = feature_extraction(df, self.ft_model, self.nlp)
+        features = self._extract_features(df)
         
         # Classify using selected model
         if model_type == "transformers" and self.transformers_pipeline:
@@ -178,7 +302,8 @@ class SentimentAnalyzer:
             overall_sentiment = None
         
         # Get aspect-based classification
-        results_df, more_than_one, no_cat = classify(df, features, self.custom_model)
+        with metrics.stage_timer("classify"):
+            results_df, more_than_one, no_cat = classify(df, features, self.custom_model, cache=self.prediction_cache)
         
         # Format results
         result = {
@@ -199,6 +324,111 @@ class SentimentAnalyzer:
         
         return result
     
+    def analyze_texts(self, texts: List[str], ids: Optional[List] = None, model_type: Optional[str] = None) -> List[Dict]:
+        """
+        Analyze many review texts independently, in one batched pass
+        
+        Each text gets the same result analyze_single_review would give it, but all
+        texts are preprocessed, parsed and scored together.
+        
+        Args:
+            texts: Review texts
+            ids: Optional ids returned with the results of the texts
+            model_type: Optional model type override
+            
+        Returns:
+            List of analysis results dictionaries in the order of texts
+        """
+        if model_type is None:
+            model_type = self.model_type
+        
+        with metrics.stage_timer("preprocess"):
+            processed_texts = preprocess_texts(texts, self.nlp)
+        
+        valid = [i for i, processed_text in enumerate(processed_texts) if not pd.isna(processed_text) and processed_text]
+        df = pd.DataFrame({
+            'reviewText': [processed_texts[i] for i in valid],
+            'rating': [5] * len(valid)  # Dummy rating for analysis
+        }, index=valid)
+        if valid:
+            with metrics.stage_timer("parse"):
+                df = construct_spacy_obj(df, self.nlp)
+        
+        # Features are looked up per text, the sentences of every text are then scored together
+        features = {}
+        categories, sentences, review_ids = [], [], []
+        for i in valid:
+            review_df = df.loc[[i]]
+            features[i] = self._extract_features(review_df)
+            review_categories, review_sentences, review_review_ids, _, _ = categorize_sentences(review_df, features[i])
+            categories.extend(review_categories)
+            sentences.extend(review_sentences)
+            review_ids.extend(review_review_ids)
+        
+        with metrics.stage_timer("classify"):
+            sentiments = predict_sentences(self.custom_model, sentences, cache=self.prediction_cache)
+        
+        classifications = {i: [] for i in valid}
+        for review_id, category, sentence, sentiment in zip(review_ids, categories, sentences, sentiments):
+            classifications[review_id].append({"category": category, "sentence": sentence, "sentiment": sentiment})
+        
+        results = []
+        for i, text in enumerate(texts):
+            if i not in classifications:
+                result = {
+                    "error": "Text too short or invalid after preprocessing",
+                    "original_text": text
+                }
+            else:
+                if model_type == "transformers" and self.transformers_pipeline:
+                    overall_sentiment = self._predict_with_transformers(text)
+                else:
+                    overall_sentiment = None
+                
+                classification = classifications[i]
+                result = {
+                    "original_text": text,
+                    "processed_text": processed_texts[i],
+                    "language": self.detect_language(text),
+                    "model_used": model_type,
+                    "features": features[i],
+                    "classification": classification,
+                    "overall_sentiment": overall_sentiment,
+                    "summary": {
+                        "total_sentences": len(classification),
+                        "positive_count": sum(row["sentiment"] == "Positive" for row in classification),
+                        "negative_count": sum(row["sentiment"] == "Negative" for row in classification),
+                        "features_found": len(features[i])
+                    }
+                }
+            
+            if ids is not None:
+                result["id"] = ids[i]
+            results.append(result)
+        
+        return results
+    
+    def _extract_features(self, df: pd.DataFrame, weights: Optional[pd.Series] = None) -> Dict:
+        """
+        Get the feature lookup for parsed reviews
+        
+        Small inputs don't have enough nouns for corpus-level feature extraction,
+        so they use the taxonomy built from the training corpus when it exists.
+        
+        Args:
+            df: DataFrame with a 'spacyObj' column
+            weights: Optional number of copies of each review (after deduplication)
+            
+        Returns:
+            Feature dictionary mapping each feature to its related features
+        """
+        total_reviews = len(df) if weights is None else int(weights[df.index].sum())
+        with metrics.stage_timer("feature_extraction"):
+            if self.taxonomy is not None and total_reviews <= config.SMALL_BATCH_MAX_REVIEWS:
+                return features_in_reviews(df, self.taxonomy)
+            
+            return features_from_counts(*count_nouns(df, self.nlp, weights), self.ft_model)
+    
     def _predict_with_transformers(self, text: str) -> Dict:
         """
         Predict sentiment using transformers
@@ -213,7 +443,8 @@ class SentimentAnalyzer:
             return None
         
         try:
-            results = self.transformers_pipeline(text[:512])[0]  # Limit to 512 tokens
+            with metrics.stage_timer("transformers"):
+                results = self.transformers_pipeline(text[:512])[0]  # Limit to 512 tokens
             
             # Convert to standardized format
             sentiment_map = {
@@ -250,25 +481,24 @@ class SentimentAnalyzer:
         if progress_callback:
             progress_callback(0, total_reviews, "Preprocessing reviews...")
         
-        df = preprocess(df, self.nlp)
-        
-        if progress_callback:
-            progress_callback(total_reviews * 0.3, total_reviews, "Constructing linguistic features...")
-        
-        # Construct Spacy objects
-        df = construct_spacy_obj(df, self.nlp)
+        df, representatives, weights = self._parse_reviews(df)
         
         if progress_callback:
             progress_callback(total_reviews * 0.5, total_reviews, "Extracting features...")
         
         # Extract features
-        features = feature_extraction(df, self.ft_model, self.nlp)
+        features = self._extract_features(df, weights)
         
         if progress_callback:
             progress_callback(total_reviews * 0.8, total_reviews, "Classifying sentiments...")
         
         # Classify
-        results_df, more_than_one, no_cat = classify(df, features, self.custom_model)
+        with metrics.stage_timer("classify"):
+            results_df, more_than_one, no_cat = classify(df, features, self.custom_model, cache=self.prediction_cache)
+        
+        # Give every duplicate review the results of the copy that was analyzed
+        if representatives is not None:
+            results_df = expand_duplicates(results_df, representatives)
         
         if progress_callback:
             progress_callback(total_reviews, total_reviews, "Complete!")
@@ -277,32 +507,284 @@ class SentimentAnalyzer:
         from utils import format_results_for_display
         results = format_results_for_display(features, results_df)
         
+        if representatives is not None:
+            valid_reviews = len(representatives)
+            unique_reviews = representatives.nunique()
+            results["summary"]["total_reviews"] = valid_reviews
+            results["summary"]["unique_reviews"] = unique_reviews
+            # Share of reviews that were duplicates of another review
+            results["summary"]["dedup_ratio"] = round(1 - unique_reviews / valid_reviews, 4) if valid_reviews else 0.0
+        
         return results
     
-    def explain_prediction(self, text: str, method: str = "lime") -> Dict:
+    def analyze_batch_iter(self, df: pd.DataFrame, chunk_size: Optional[int] = None,
+                           features: Optional[Dict] = None, progress_callback=None,
+                           deadline: Optional[float] = None) -> Iterator[Dict]:
+        """
+        Analyze batch of reviews chunk by chunk, yielding results as they are produced
+        
+        Reviews are classified against a fixed feature lookup: the given features, or
+        the ones analyze_batch would use, so the chunks add up to its results. That is
+        the taxonomy built from the training corpus for batches of up to
+        SMALL_BATCH_MAX_REVIEWS reviews, and features extracted from the whole batch
+        otherwise. Those are extracted in a first pass over the chunks, which only adds
+        each chunk's nouns to running counts and yields an item without rows in the
+        "features" stage; the chunks are then parsed again to be classified in the
+        "classify" stage. Only one chunk is parsed at a time and only running counts
+        are kept between chunks, so memory doesn't grow with the size of the batch.
+        
+        The deadline is checked before every chunk. Once it has passed, a last item
+        without rows and with partial set to True is yielded instead of the rest.
+        
+        Args:
+            df: DataFrame with 'reviewText' and 'rating' columns
+            chunk_size: Reviews per chunk (defaults to config.STREAM_CHUNK_SIZE)
+            features: Optional feature lookup to classify against
+            progress_callback: Optional callback function for progress updates
+            deadline: Optional time.time() by which to stop
+            
+        Yields:
+            Dictionary with the stage, the chunk's classification rows, running per-feature
+            counts, running summary, reviews processed so far in the stage, whether this is
+            the last chunk and whether the deadline cut the analysis short
+        """
+        total_reviews = len(df)
+        chunk_size = chunk_size or config.STREAM_CHUNK_SIZE
+        chunks = [df.iloc[start:start + chunk_size] for start in range(0, total_reviews, chunk_size)]
+        
+        if not chunks:
+            yield {
+                "stage": "classify",
+                "classification": [],
+                "features": {},
+                "summary": {"total_sentences": 0, "positive_count": 0, "negative_count": 0, "features_found": 0},
+                "processed": 0,
+                "total": 0,
+                "done": True,
+                "partial": False
+            }
+            return
+        
+        if features is None and self.taxonomy is not None and total_reviews <= config.SMALL_BATCH_MAX_REVIEWS:
+            features = self.taxonomy
+        
+        running_features = OrderedDict()
+        summary = {
+            "total_sentences": 0,
+            "positive_count": 0,
+            "negative_count": 0,
+            "features_found": 0
+        }
+        if config.DEDUPLICATE_REVIEWS:
+            summary.update(self._review_counts(df))
+        
+        def feature_counts():
+            # In the order of the feature lookup, like analyze_batch
+            return {feature: dict(running_features[feature]) for feature in features or () if feature in running_features}
+        
+        def cut_short(stage, processed):
+            return {
+                "stage": stage,
+                "classification": [],
+                "features": feature_counts(),
+                "summary": dict(summary),
+                "processed": processed,
+                "total": total_reviews,
+                "done": True,
+                "partial": True
+            }
+        
+        if features is None:
+            # Features need the nouns of the whole batch, count them chunk by chunk first
+            all_nouns, noun_phrases = Counter(), Counter()
+            counted = 0
+            for chunk in chunks:
+                if deadline_passed(deadline):
+                    yield cut_short("features", counted)
+                    return
+                parsed_df, _, weights = self._parse_reviews(chunk.copy())
+                with metrics.stage_timer("feature_extraction"):
+                    count_nouns(parsed_df, self.nlp, weights, all_nouns, noun_phrases)
+                del parsed_df
+                counted += len(chunk)
+                
+                if progress_callback:
+                    progress_callback(counted, total_reviews, "Extracting features...")
+                
+                yield {
+                    "stage": "features",
+                    "classification": [],
+                    "features": {},
+                    "summary": dict(summary),
+                    "processed": counted,
+                    "total": total_reviews,
+                    "done": False,
+                    "partial": False
+                }
+            
+            with metrics.stage_timer("feature_extraction"):
+                features = features_from_counts(all_nouns, noun_phrases, self.ft_model)
+            del all_nouns, noun_phrases
+            
+            # analyze_batch reports every extracted feature, also those without sentences
+            for feature, related in features.items():
+                running_features[feature] = {"related": related, "positives": 0, "negatives": 0, "total": 0}
+        
+        processed = 0
+        
+        for chunk in chunks:
+            if deadline_passed(deadline):
+                yield cut_short("classify", processed)
+                return
+            
+            parsed_df, representatives, _ = self._parse_reviews(chunk.copy())
+            with metrics.stage_timer("classify"):
+                results_df, _, _ = classify(parsed_df, features, self.custom_model, cache=self.prediction_cache)
+            if representatives is not None:
+                results_df = expand_duplicates(results_df, representatives)
+            
+            for feature, related in features_in_reviews(parsed_df, features).items():
+                if feature not in running_features:
+                    running_features[feature] = {"related": related, "positives": 0, "negatives": 0, "total": 0}
+            
+            rows = []
+            for category, sentence, sentiment in zip(results_df["category"], results_df["sentence"], results_df["sentiment"]):
+                rows.append({"category": category, "sentence": sentence, "sentiment": sentiment})
+                
+                if sentiment == "Positive":
+                    running_features[category]["positives"] += 1
+                    summary["positive_count"] += 1
+                else:
+                    running_features[category]["negatives"] += 1
+                    summary["negative_count"] += 1
+                running_features[category]["total"] += 1
+            
+            summary["total_sentences"] += len(rows)
+            summary["features_found"] = len(running_features)
+            processed += len(chunk)
+            
+            if progress_callback:
+                progress_callback(processed, total_reviews, "Classifying sentiments...")
+            
+            yield {
+                "stage": "classify",
+                "classification": rows,
+                "features": feature_counts(),
+                "summary": dict(summary),
+                "processed": processed,
+                "total": total_reviews,
+                "done": processed == total_reviews,
+                "partial": False
+            }
+    
+    def analyze_batch_within(self, df: pd.DataFrame, deadline: Optional[float], chunk_size: Optional[int] = None) -> Dict:
+        """
+        Analyze batch of reviews chunk by chunk until a deadline
+        
+        Args:
+            df: DataFrame with 'reviewText' and 'rating' columns
+            deadline: time.time() by which to stop, or None for no deadline
+            chunk_size: Reviews per chunk (defaults to config.STREAM_CHUNK_SIZE)
+            
+        Returns:
+            Analysis results dictionary like analyze_batch's, with the sentences classified
+            before the deadline, whether it cut the analysis short and the reviews processed
+        """
+        rows = []
+        for partial in self.analyze_batch_iter(df, chunk_size, deadline=deadline):
+            rows.extend(partial["classification"])
+        
+        return {
+            "features": partial["features"],
+            "classification": rows,
+            "summary": {**partial["summary"], "total_reviews": partial["summary"].get("total_reviews", partial["total"])},
+            "partial": partial["partial"],
+            # Cut short while extracting features, before any review was classified
+            "processed_reviews": partial["processed"] if partial["stage"] == "classify" else 0
+        }
+        
+    def _review_counts(self, df: pd.DataFrame) -> Dict:
+        """
+        Count the reviews and unique reviews of a batch like analyze_batch does
+        
+        Args:
+            df: DataFrame with 'reviewText' and 'rating' columns
+            
+        Returns:
+            Dictionary with total_reviews, unique_reviews and dedup_ratio
+        """
+        _, representatives = deduplicate_reviews(df)
+        valid_reviews = len(representatives)
+        unique_reviews = representatives.nunique()
+        return {
+            "total_reviews": valid_reviews,
+            "unique_reviews": unique_reviews,
+            "dedup_ratio": round(1 - unique_reviews / valid_reviews, 4) if valid_reviews else 0.0
+        }
+    
+    def _parse_reviews(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[pd.Series], Optional[pd.Series]]:
+        """
+        Deduplicate, preprocess and parse reviews
+        
+        Args:
+            df: DataFrame with 'reviewText' and 'rating' columns
+            
+        Returns:
+            Tuple of (parsed dataframe, representative review of every review, copies of
+            every parsed review); the last two are None when deduplication is disabled
+        """
+        # Collapse identical reviews, only one copy of each goes through the NLP stages
+        if config.DEDUPLICATE_REVIEWS:
+            df, representatives = deduplicate_reviews(df)
+            weights = representatives.value_counts()
+        else:
+            representatives = None
+            weights = None
+        
+        if config.FUSED_PREPROCESSING:
+            # Normalize, tag and sentencize with a single tokenizer pass
+            with metrics.stage_timer("preprocess_parse"):
+                df = preprocess_and_parse(df, self.nlp)
+        else:
+            with metrics.stage_timer("preprocess"):
+                df = preprocess(df, self.nlp)
+            
+            # Construct Spacy objects
+            with metrics.stage_timer("parse"):
+                df = construct_spacy_obj(df, self.nlp)
+        
+        return df, representatives, weights
+    
+    def explain_prediction(self, text: str, method: str = "lime", deadline: Optional[float] = None) -> Dict:
         """
         Explain model prediction using LIME or SHAP
         
         Args:
             text: Input text
             method: Explanation method ("lime" or "shap")
+            deadline: Optional time.time() by which to stop
             
         Returns:
             Explanation dictionary
         """
         if method == "lime" and self.lime_explainer:
-            return self._explain_with_lime(text)
+            return self._explain_with_lime(text, deadline)
         elif method == "shap" and SHAP_AVAILABLE:
             return self._explain_with_shap(text)
         else:
             return {"error": f"Explanation method {method} not available"}
     
-    def _explain_with_lime(self, text: str) -> Dict:
+    def _explain_with_lime(self, text: str, deadline: Optional[float] = None) -> Dict:
         """
         Explain prediction using LIME
         
+        Scoring the perturbed samples is checked against the deadline. When it
+        passes, no words are returned, only the prediction for the text itself
+        (LIME's first sample) if it was scored, with partial set to True.
+        
         Args:
             text: Input text
+            deadline: Optional time.time() by which to stop
             
         Returns:
             LIME explanation
@@ -311,7 +793,9 @@ class SentimentAnalyzer:
             # Create prediction function
             def predict_proba(texts):
                 predictions = []
-                for t in texts:
+                for i, t in enumerate(texts):
+                    if i % LIME_DEADLINE_CHECK_EVERY == 0 and deadline_passed(deadline):
+                        raise DeadlineExceeded(predictions)
                     try:
                         pred = self.custom_model.predict([t])[0]
                         # Convert to probability-like scores
@@ -324,17 +808,28 @@ class SentimentAnalyzer:
                 return np.array(predictions)
             
             # Generate explanation
-            exp = self.lime_explainer.explain_instance(
-                text,
-                predict_proba,
-                num_features=10
-            )
+            try:
+                with metrics.stage_timer("lime"):
+                    exp = self.lime_explainer.explain_instance(
+                        text,
+                        predict_proba,
+                        num_features=10
+                    )
+            except DeadlineExceeded as e:
+                return {
+                    "method": "LIME",
+                    "important_words": [],
+                    "prediction": e.done[0] if e.done else None,
+                    "partial": True,
+                    "samples_scored": len(e.done)
+                }
             
             # Extract important words
             explanation = {
                 "method": "LIME",
                 "important_words": exp.as_list(),
-                "prediction": exp.predict_proba.tolist() if hasattr(exp, 'predict_proba') else None
+                "prediction": exp.predict_proba.tolist() if hasattr(exp, 'predict_proba') else None,
+                "partial": False
             }
             
             return explanation
@@ -391,12 +886,20 @@ class SentimentAnalyzer:
 
 # Convenience functions for backward compatibility
 _default_analyzer = None
+_analyzer_lock = threading.Lock()
 
 def get_analyzer(model_type: str = "logistic_regression") -> SentimentAnalyzer:
     """Get or create sentiment analyzer instance"""
     global _default_analyzer
-    if _default_analyzer is None or _default_analyzer.model_type != model_type:
-        _default_analyzer = SentimentAnalyzer(model_type=model_type)
+    # API requests call this from several threads, only one of them should load the models
+    with _analyzer_lock:
+        if _default_analyzer is None or _default_analyzer.model_type != model_type:
+            _default_analyzer = SentimentAnalyzer(model_type=model_type)
+        return _default_analyzer
+
+
+def get_loaded_analyzer() -> Optional[SentimentAnalyzer]:
+    """Get the shared analyzer if it has been loaded, without loading it"""
     return _default_analyzer
 
 
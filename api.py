@@ -1,28 +1,95 @@
 """
 FastAPI REST API for Sentiment Analysis
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect, Query
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, FileResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict
 import pandas as pd
 from pathlib import Path
-import io
+from functools import partial
+import json
+import time
 
 # Import our modules
 import config
-from analyzer import get_analyzer
+from analyzer import get_analyzer, get_loaded_analyzer
+import executors
+import admission
+import jobs
+from microbatch import MicroBatcher
+from singleflight import SingleFlight, content_key, file_digest
+from responses import FastJSONResponse, dumps, parse_fields, project
+from middleware import BodySizeLimitMiddleware, MetricsMiddleware
+import metrics
 import utils
 
+
+# Progress of the startup warmup, reported by /health and /ready
+warmup_state = {"status": "pending", "seconds": None, "error": None}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up the models and start the job runners at startup, stop them and the analysis executors when the API stops"""
+    task = None
+    if config.WARMUP_ON_STARTUP:
+        task = asyncio.create_task(_warm_up(config.DEFAULT_MODEL))
+    else:
+        warmup_state["status"] = "skipped"
+    jobs.queue.start()
+    
+    yield
+    
+    if task is not None:
+        task.cancel()
+    jobs.queue.stop()
+    executors.shutdown()
+
+
+async def _warm_up(model_type: str):
+    """Load the analyzer and run sample reviews through it, in this process and the process pool"""
+    warmup_state["status"] = "warming"
+    try:
+        analyzer = await executors.run_scheduled("batch", get_analyzer, model_type)
+        seconds = await executors.run_scheduled("batch", analyzer.warmup)
+        if config.API_PROCESS_WORKERS > 0:
+            # Start the pool workers now, each loads and warms up its analyzer as it starts
+            await asyncio.gather(*[
+                executors.run_in_process(executors.warmup, model_type) for _ in range(config.API_PROCESS_WORKERS)
+            ])
+    except Exception as e:
+        warmup_state.update(status="failed", error=str(e))
+        print(f"Warmup failed: {e}")
+        return
+    
+    warmup_state.update(status="ready", seconds=round(seconds, 2))
+    print(f"Warmed up {model_type} analyzer in {seconds:.1f}s")
+
+
+def _is_ready() -> bool:
+    return warmup_state["status"] in ("ready", "skipped")
+
+
 # Create FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     title=config.API_TITLE,
     version=config.API_VERSION,
     description="Advanced sentiment analysis API with multi-model support",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
+# Reject request bodies over the upload limit while they are being received
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=config.MAX_UPLOAD_SIZE_MB * 1024 * 1024)
+# Count and time every request (added last so it also sees rejected ones)
+app.add_middleware(MetricsMiddleware)
+
 # Request/Response models
 class SingleReviewRequest(BaseModel):
     text: str = Field(..., description="Review text to analyze", min_length=3)
@@ -36,6 +103,20 @@ class SingleReviewRequest(BaseModel):
             }
         }
 
+class BulkAnalysisRequest(BaseModel):
+    texts: List[str] = Field(..., description="Review texts to analyze", min_length=1, max_length=config.BULK_MAX_TEXTS)
+    ids: Optional[List[str]] = Field(None, description="Optional ids returned with the result of each text")
+    model_type: Optional[str] = Field("logistic_regression", description="Model type: logistic_regression or transformers")
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "texts": ["Amazing camera!", "Battery drains too fast. Display is great."],
+                "ids": ["r1", "r2"],
+                "model_type": "logistic_regression"
+            }
+        }
+
 class SingleReviewResponse(BaseModel):
     original_text: str
     processed_text: str
@@ -45,15 +126,38 @@ class SingleReviewResponse(BaseModel):
     features: Dict
     classification: List[Dict]
 
+class BulkAnalysisResponse(BaseModel):
+    results: List[Dict]
+
 class BatchAnalysisResponse(BaseModel):
     summary: Dict
     features: Dict
     classification: List[Dict]
+    partial: bool = False
+    processed_reviews: Optional[int] = None
+
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    model_type: str
+    progress: float
+    processed: Optional[float] = None
+    total: Optional[int] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
 
 class HealthResponse(BaseModel):
     status: str
     version: str
+    ready: bool
+    warmup: Dict
     models_loaded: Dict
+    queue_depth: Dict
+    memory_mb: Optional[float] = None
 
 class FeedbackRequest(BaseModel):
     review_text: str
@@ -77,38 +181,201 @@ async def root():
 @app.get("/health", response_model=HealthResponse, tags=["General"])
 async def health_check():
     """Health check endpoint"""
+    queue_depth = admission.controller.queue_depth()
+    scheduler_stats = executors.get_scheduler().stats()
+    for group, depth in queue_depth.items():
+        depth["running"] = executors.limiters[group].in_flight
+        depth["waiting"] = executors.limiters[group].waiting
+        depth["scheduler"] = scheduler_stats[group]
+    
+    memory_mb = admission.resident_memory_mb()
+    
+    analyzer = get_loaded_analyzer()
+    if _is_ready():
+        status = "healthy"
+    elif warmup_state["status"] == "failed":
+        status = "unhealthy"
+    else:
+        status = "starting"
+    
     return {
-        "status": "healthy",
+        "status": status,
         "version": config.API_VERSION,
-        "models_loaded": {
-            "logistic_regression": True,
-            "transformers": TRANSFORMERS_AVAILABLE
-        }
+        "ready": _is_ready(),
+        "warmup": warmup_state,
+        "models_loaded": analyzer.models_loaded() if analyzer is not None else {},
+        "queue_depth": queue_depth,
+        "memory_mb": round(memory_mb, 1) if memory_mb is not None else None
     }
 
 
+@app.get("/ready", tags=["General"])
+async def readiness_check():
+    """Readiness probe: 503 until the startup warmup has finished, so no cold traffic is routed here"""
+    if not _is_ready():
+        return JSONResponse(status_code=503, content={"ready": False, **warmup_state})
+    return {"ready": True, **warmup_state}
+
+
+def _sample_executors():
+    """Set the executor and scheduler gauges, before /metrics renders or the worker shares its metrics"""
+    for group, limiter in executors.limiters.items():
+        metrics.EXECUTOR_IN_FLIGHT.set(limiter.in_flight, group=group)
+        metrics.EXECUTOR_WAITING.set(limiter.waiting, group=group)
+    for workload, stats in executors.get_scheduler().stats().items():
+        metrics.SCHEDULER_QUEUED.set(stats["queued"], workload=workload)
+
+
+metrics.add_collector(_sample_executors)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["General"])
+async def get_metrics():
+    """Metrics in the Prometheus text exposition format, the totals of every pre-fork worker"""
+    text = await executors.run_in_thread(metrics.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
 @app.post("/analyze/single", response_model=SingleReviewResponse, tags=["Analysis"])
-async def analyze_single_review(request: SingleReviewRequest):
+async def analyze_single_review(
+    request: SingleReviewRequest,
+    fields: Optional[str] = Query(None, description="Comma separated fields to return, e.g. summary,features.*.total")
+):
     """
     Analyze a single review
     
     Args:
         request: Review analysis request
+        fields: Optional fields to return (see responses.parse_fields), all of them by default
         
     Returns:
         Analysis results
     """
+    paths = _parse_fields(fields, SingleReviewResponse)
+    admission.controller.check("single")
+    
     try:
-        # Get analyzer
-        analyzer = get_analyzer(request.model_type)
-        
-        # Analyze
-        results = analyzer.analyze_single_review(request.text, request.model_type)
+        with admission.controller.track("single"):
+            results = await _analyze_review(request.text, request.model_type)
         
         if "error" in results:
             raise HTTPException(status_code=400, detail=results["error"])
         
-        return results
+        return _respond(results, SingleReviewResponse, paths)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+
+@app.websocket("/ws/analyze")
+async def analyze_review_stream(websocket: WebSocket, model_type: str = "logistic_regression"):
+    """
+    Analyze a stream of reviews sent over a WebSocket
+    
+    Every message is a JSON object {"id": ..., "text": ...}. It is answered on the
+    same socket, in the order the messages arrived, with {"id": ..., "result": {...}}
+    or {"id": ..., "error": "..."}. Reviews go through the same micro-batcher as
+    /analyze/single. Once WEBSOCKET_MAX_PENDING reviews of a connection are being
+    analyzed or sent, the socket is not read until one is answered, so a client
+    sending faster than its reviews are classified is held back by TCP flow control.
+    Every review counts against the single group's admission budget; one that
+    doesn't fit is answered with an error.
+    
+    Args:
+        websocket: Client connection
+        model_type: Model type used for every review of the connection
+    """
+    await websocket.accept()
+    pending = asyncio.Queue(maxsize=config.WEBSOCKET_MAX_PENDING)
+    sender = asyncio.create_task(_send_stream_replies(websocket, pending))
+    
+    try:
+        while True:
+            message = await websocket.receive_text()
+            # Waits while the connection has too many reviews pending
+            await pending.put(asyncio.ensure_future(_analyze_stream_message(message, model_type)))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        while not pending.empty():
+            pending.get_nowait().cancel()
+
+
+async def _send_stream_replies(websocket: WebSocket, pending: asyncio.Queue):
+    """Send the replies of a WebSocket connection's reviews in the order they arrived"""
+    while True:
+        reply = await (await pending.get())
+        try:
+            await websocket.send_json(reply)
+        except Exception:
+            # The client is gone, the receiving loop stops at its next receive
+            pass
+
+
+async def _analyze_stream_message(message: str, model_type: str) -> Dict:
+    """
+    Analyze the review in a WebSocket message
+    
+    Args:
+        message: JSON message with the review text and an optional id
+        model_type: Model type to use
+        
+    Returns:
+        Reply with the id and the result or an error
+    """
+    try:
+        review = json.loads(message)
+    except ValueError:
+        return {"id": None, "error": "Message is not valid JSON"}
+    
+    if not isinstance(review, dict):
+        return {"id": None, "error": "Message must be a JSON object"}
+    review_id = review.get("id")
+    text = review.get("text")
+    if not isinstance(text, str) or len(text) < 3:
+        return {"id": review_id, "error": "Message needs a text of at least 3 characters"}
+    
+    try:
+        admitted = admission.controller.admit("single")
+    except HTTPException as e:
+        return {"id": review_id, "error": e.detail}
+    
+    try:
+        with admitted:
+            results = await _analyze_review(text, model_type)
+    except Exception as e:
+        return {"id": review_id, "error": f"Analysis failed: {str(e)}"}
+    
+    if "error" in results:
+        return {"id": review_id, "error": results["error"]}
+    return {"id": review_id, "result": results}
+
+
+@app.post("/analyze/bulk", response_model=BulkAnalysisResponse, tags=["Analysis"])
+async def analyze_bulk_reviews(request: BulkAnalysisRequest):
+    """
+    Analyze many reviews in one request
+    
+    Every text is analyzed on its own, as by /analyze/single, but all of them
+    go through preprocessing, parsing and classification together.
+    
+    Args:
+        request: Texts to analyze with optional ids
+        
+    Returns:
+        Analysis results of each text in input order (texts that are too short get an error)
+    """
+    if request.ids is not None and len(request.ids) != len(request.texts):
+        raise HTTPException(status_code=400, detail="ids must have one entry per text")
+    admission.controller.check("batch")
+    
+    try:
+        with admission.controller.track("batch"):
+            async with executors.limiters["batch"]:
+                results = await executors.run_in_process(executors.analyze_texts, request.texts, request.ids, request.model_type)
+        
+        return {"results": results}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
@@ -116,40 +383,143 @@ async def analyze_single_review(request: SingleReviewRequest):
 
 @app.post("/analyze/batch", response_model=BatchAnalysisResponse, tags=["Analysis"])
 async def analyze_batch_reviews(
+    request: Request,
     file: UploadFile = File(..., description="CSV file with reviews"),
-    model_type: str = "logistic_regression"
+    model_type: str = "logistic_regression",
+    stream: bool = False,
+    deadline_ms: Optional[int] = Query(None, gt=0, description="Stop analyzing after this many milliseconds"),
+    fields: Optional[str] = Query(None, description="Comma separated fields to return, e.g. summary,features.*.total")
 ):
     """
     Analyze batch of reviews from CSV file
     
+    With `stream=true` or an `Accept: application/x-ndjson` header the results are
+    streamed as newline-delimited JSON while the reviews are analyzed: a "row" record
+    per classified sentence and a "progress" record after every chunk of reviews,
+    followed by a final "summary" record with the summary and per-feature counts.
+    The streamed results are the same as the non-streamed ones. Batches too large
+    for the persisted taxonomy first have their features extracted, chunk by chunk
+    with "progress" records in the "features" stage, before their chunks are
+    classified in the "classify" stage. Reviews are parsed one chunk at a time, so
+    memory is bounded by the chunk size (see analyze_batch_iter).
+    
+    With `deadline_ms` the reviews are analyzed chunk by chunk, like when streaming,
+    and the analysis stops at the first chunk boundary after the deadline (counted
+    from when the request arrived). The sentences classified until then are returned
+    with `partial: true` and the number of reviews processed.
+    
+    Uploads of the same CSV with the same model type and deadline_ms that arrive
+    while one of them is being analyzed share its results (not when streaming).
+    
     Args:
+        request: Incoming request
         file: CSV file with reviews (columns: reviewText, rating)
         model_type: Model type to use
+        stream: Stream the results as NDJSON
+        deadline_ms: Optional time limit in milliseconds
+        fields: Optional fields to return (see responses.parse_fields), all of them by default
+            (ignored when streaming)
         
     Returns:
         Batch analysis results
     """
+    paths = _parse_fields(fields, BatchAnalysisResponse)
+    # Held while the upload is read and analyzed, or streamed
+    admitted = admission.controller.admit("batch")
+    deadline = _deadline(deadline_ms)
+    streaming = False
+    
     try:
-        # Read CSV
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents), header=None, names=['reviewText', 'rating'])
-        
-        # Validate
-        if df.empty:
-            raise HTTPException(status_code=400, detail="CSV file is empty")
+        if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+            df = await _read_batch(file.file)
+            streaming = True
+            # The stream releases the slot when it ends; the background task covers a stream that never started
+            return StreamingResponse(
+                _stream_batch(df, model_type, deadline, admitted), media_type="application/x-ndjson",
+                background=BackgroundTask(admitted.release)
+            )
         
-        # Get analyzer
-        analyzer = get_analyzer(model_type)
+        analyze = partial(_analyze_batch, file.file, model_type, deadline)
+        if config.SINGLEFLIGHT_ENABLED:
+            # Identical uploads being analyzed at the same time share one analysis, only
+            # the first one's CSV is parsed (hashing leaves the upload at its start)
+            digest = await executors.run_in_thread(file_digest, file.file)
+            results = await single_flights["batch"].run(content_key(digest, model_type, deadline_ms), analyze)
+        else:
+            results = await analyze()
         
-        # Analyze
-        results = analyzer.analyze_batch(df)
-        
-        return results
+        return _respond(results, BatchAnalysisResponse, paths)
     
+    except HTTPException:
+        raise
+    except pd.errors.EmptyDataError:
+        raise HTTPException(status_code=400, detail="CSV file is empty")
     except pd.errors.ParserError:
         raise HTTPException(status_code=400, detail="Invalid CSV format")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    finally:
+        if not streaming:
+            admitted.release()
+
+
+async def _read_batch(file) -> pd.DataFrame:
+    """Read the uploaded CSV off the event loop, rejecting an empty one"""
+    df = await executors.run_in_thread(utils.read_reviews_csv, file)
+    if df.empty:
+        raise HTTPException(status_code=400, detail="CSV file is empty")
+    return df
+
+
+async def _analyze_batch(file, model_type: str, deadline: Optional[float]) -> Dict:
+    """Read the uploaded CSV and analyze it in a worker process"""
+    df = await _read_batch(file)
+    async with executors.limiters["batch"]:
+        return await executors.run_in_process(executors.analyze_batch, df, model_type, deadline)
+
+
+async def _stream_batch(df: pd.DataFrame, model_type: str, deadline: Optional[float], admitted: admission.Admission):
+    """
+    Analyze a batch chunk by chunk and yield the results as NDJSON
+    
+    Chunks are analyzed and encoded on the scheduler, one at a time as the client
+    reads them, so only one chunk of results is held in memory. The request's
+    admission slot is released when the stream ends or is closed.
+    """
+    with admitted:
+        async with executors.limiters["batch"]:
+            analyzer = await executors.run_scheduled("batch", get_analyzer, model_type)
+            partials = analyzer.analyze_batch_iter(df, deadline=deadline)
+            try:
+                while True:
+                    lines = await executors.run_scheduled("batch", _next_ndjson_chunk, partials)
+                    if lines is None:
+                        break
+                    yield lines
+            except Exception as e:
+                # The response has already started, so the error is reported in the stream
+                yield dumps({"type": "error", "detail": f"Analysis failed: {str(e)}"}) + b"\n"
+
+
+def _next_ndjson_chunk(partials) -> Optional[bytes]:
+    """Analyze the next chunk and encode its records as NDJSON with responses.dumps (runs on the scheduler)"""
+    partial = next(partials, None)
+    if partial is None:
+        return None
+    
+    lines = [dumps({"type": "row", **row}) for row in partial["classification"]]
+    lines.append(dumps({
+        "type": "progress", "stage": partial["stage"], "processed": partial["processed"], "total": partial["total"]
+    }))
+    if partial["done"]:
+        summary = {**partial["summary"], "total_reviews": partial["summary"].get("total_reviews", partial["total"])}
+        processed = partial["processed"] if partial["stage"] == "classify" else 0
+        lines.append(dumps({
+            "type": "summary", "summary": summary, "features": partial["features"],
+            "partial": partial["partial"], "processed_reviews": processed
+        }))
+    
+    return b"\n".join(lines) + b"\n"
 
 
 @app.post("/analyze/compare", tags=["Analysis"])
@@ -163,9 +533,12 @@ async def compare_models(request: SingleReviewRequest):
     Returns:
         Comparison results
     """
+    admission.controller.check("single")
+    
     try:
-        analyzer = get_analyzer("logistic_regression")
-        comparison = analyzer.compare_models(request.text)
+        with admission.controller.track("single"):
+            async with executors.limiters["single"]:
+                comparison = await executors.run_scheduled("single", _compare_models, request.text)
         return comparison
     
     except Exception as e:
@@ -175,21 +548,34 @@ async def compare_models(request: SingleReviewRequest):
 @app.post("/explain", tags=["Explainability"])
 async def explain_prediction(
     request: SingleReviewRequest,
-    method: str = "lime"
+    method: str = "lime",
+    deadline_ms: Optional[int] = Query(None, gt=0, description="Stop explaining after this many milliseconds")
 ):
     """
     Explain model prediction
     
+    With `deadline_ms`, LIME stops scoring its perturbed samples once the deadline
+    (counted from when the request arrived) has passed and the response has
+    `partial: true`, no important words and the prediction for the text if it was
+    scored by then.
+    
     Args:
         request: Review text
         method: Explanation method (lime or shap)
+        deadline_ms: Optional time limit in milliseconds
         
     Returns:
         Explanation results
     """
+    admission.controller.check("explain")
+    deadline = _deadline(deadline_ms)
+    
     try:
-        analyzer = get_analyzer(request.model_type)
-        explanation = analyzer.explain_prediction(request.text, method=method)
+        with admission.controller.track("explain"):
+            async with executors.limiters["explain"]:
+                explanation = await executors.run_scheduled(
+                    "explain", _explain_prediction, request.text, request.model_type, method, deadline
+                )
         
         if "error" in explanation:
             raise HTTPException(status_code=400, detail=explanation["error"])
@@ -200,6 +586,98 @@ async def explain_prediction(
         raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
 
 
+@app.post("/jobs", response_model=JobResponse, status_code=202, tags=["Jobs"])
+async def submit_job(
+    file: UploadFile = File(..., description="CSV file with reviews"),
+    model_type: str = "logistic_regression"
+):
+    """
+    Queue a batch analysis of a CSV file
+    
+    Returns the job right away. The CSV is analyzed in the background; poll
+    /jobs/{job_id} for progress and fetch /jobs/{job_id}/result once it completed.
+    Queued jobs are kept on disk and survive an API restart.
+    
+    Args:
+        file: CSV file with reviews (columns: reviewText, rating)
+        model_type: Model type to use
+        
+    Returns:
+        The queued job
+    """
+    if await executors.run_in_thread(jobs.queue.count, jobs.QUEUED) >= config.JOB_MAX_QUEUED:
+        raise HTTPException(
+            status_code=429, detail="Too many jobs queued, retry later",
+            headers={"Retry-After": str(config.ADMISSION_RETRY_AFTER)}
+        )
+    
+    return await executors.run_in_thread(jobs.queue.submit, file.file, model_type)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse, tags=["Jobs"])
+async def get_job(job_id: str):
+    """
+    Get the status and progress of a job
+    
+    Args:
+        job_id: Job id
+        
+    Returns:
+        The job
+    """
+    return await _find_job(job_id)
+
+
+@app.get("/jobs/{job_id}/result", tags=["Jobs"])
+async def get_job_result(job_id: str):
+    """
+    Download the result of a completed job
+    
+    Args:
+        job_id: Job id
+        
+    Returns:
+        Batch analysis results as JSON
+    """
+    job = await _find_job(job_id)
+    if job["status"] == jobs.FAILED:
+        raise HTTPException(status_code=409, detail=f"Job failed: {job['error']}")
+    if job["status"] != jobs.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    
+    return FileResponse(jobs.queue.result_path(job_id), media_type="application/json", filename=f"{job_id}.json")
+
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse, tags=["Jobs"])
+async def cancel_job(job_id: str):
+    """
+    Cancel a job, or delete it and its result once it has finished
+    
+    A queued job is cancelled right away, a running one within a few seconds
+    (check cancel_requested and poll until its status is cancelled).
+    
+    Args:
+        job_id: Job id
+        
+    Returns:
+        The job as it was before deletion, or after the cancellation request
+    """
+    job = await _find_job(job_id)
+    if job["status"] in jobs.FINISHED:
+        await executors.run_in_thread(jobs.queue.delete, job_id)
+        return job
+    
+    return await executors.run_in_thread(jobs.queue.cancel, job_id)
+
+
+async def _find_job(job_id: str) -> Dict:
+    """Get a job or raise 404"""
+    job = await executors.run_in_thread(jobs.queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @app.post("/feedback", tags=["Feedback"])
 async def submit_feedback(feedback: FeedbackRequest):
     """
@@ -237,12 +715,93 @@ async def get_feedback_statistics():
         raise HTTPException(status_code=500, detail=f"Failed to retrieve stats: {str(e)}")
 
 
-# For imports in analyzer
-try:
-    from transformers import pipeline
-    TRANSFORMERS_AVAILABLE = True
-except:
-    TRANSFORMERS_AVAILABLE = False
+async def _analyze_review(text: str, model_type: str) -> Dict:
+    """
+    Analyze a single review on the scheduler, so the event loop keeps serving other requests
+    
+    Requests for the same text and model type that arrive while it is being analyzed
+    share its result.
+    """
+    if config.SINGLEFLIGHT_ENABLED:
+        return await single_flights["single"].run(
+            content_key(text, model_type), partial(_compute_review, text, model_type)
+        )
+    return await _compute_review(text, model_type)
+
+
+async def _compute_review(text: str, model_type: str) -> Dict:
+    """Analyze a single review"""
+    if config.MICROBATCH_ENABLED:
+        # Together with the other reviews that arrive at about the same time
+        return await _single_batcher(model_type).submit(text)
+    
+    async with executors.limiters["single"]:
+        return await executors.run_scheduled("single", _analyze_single, text, model_type)
+
+
+def _analyze_single(text: str, model_type: str) -> Dict:
+    """Analyze a single review (runs on the scheduler)"""
+    analyzer = get_analyzer(model_type)
+    return analyzer.analyze_single_review(text, model_type)
+
+
+def _analyze_singles(texts: List[str], model_type: str) -> List[Dict]:
+    """Analyze single reviews gathered by the micro-batcher (runs on the scheduler)"""
+    analyzer = get_analyzer(model_type)
+    return analyzer.analyze_texts(texts, model_type=model_type)
+
+
+_single_batchers = {}
+single_flights = {"single": SingleFlight("single"), "batch": SingleFlight("batch")}
+
+
+def _single_batcher(model_type: str) -> MicroBatcher:
+    """Get the micro-batcher for single reviews of a model type"""
+    if model_type not in _single_batchers:
+        _single_batchers[model_type] = MicroBatcher(partial(_analyze_singles, model_type=model_type))
+    return _single_batchers[model_type]
+
+
+def _compare_models(text: str) -> Dict:
+    """Compare model predictions (runs on the scheduler)"""
+    analyzer = get_analyzer("logistic_regression")
+    return analyzer.compare_models(text)
+
+
+def _explain_prediction(text: str, model_type: str, method: str, deadline: Optional[float] = None) -> Dict:
+    """Explain a prediction (runs on the scheduler)"""
+    analyzer = get_analyzer(model_type)
+    return analyzer.explain_prediction(text, method=method, deadline=deadline)
+
+
+def _parse_fields(fields: Optional[str], model) -> List[str]:
+    """Paths of the response fields a request asked for, all of the response model's by default"""
+    try:
+        return parse_fields(fields, model.model_fields) or list(model.model_fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _respond(results: Dict, model, paths: List[str]) -> FastJSONResponse:
+    """
+    Send analysis results without validating them against the response model
+    
+    Fields of the model missing from the results get their defaults, and only
+    the requested paths are sent.
+    """
+    content = {
+        name: results[name] if name in results else field.default
+        for name, field in model.model_fields.items()
+        if name in results or not field.is_required()
+    }
+    return FastJSONResponse(project(content, paths))
+
+
+def _deadline(deadline_ms: Optional[int]) -> Optional[float]:
+    """Turn a request's deadline_ms into the time.time() by which to stop"""
+    if deadline_ms is None:
+        return None
+    return time.time() + deadline_ms / 1000
 
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+"""
+Benchmark for /analyze/bulk against one /analyze/single call per review
+
+Starts the API with uvicorn and analyzes the same reviews from a csv file once
+with sequential /analyze/single calls and once with a single /analyze/bulk call,
+checking that both give the same result for every review.
+
+Usage:
+    python benchmarks/bench_bulk.py [csv_name] [n_reviews]
+"""
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+import requests
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+
+PORT = 8766
+URL = f"http://127.0.0.1:{PORT}"
+
+
+def wait_for_server(timeout=120):
+    """Wait until the API answers"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(URL + "/health", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.5)
+    raise RuntimeError("API did not start")
+
+
+def single_calls(session, texts):
+    """Analyze each text with its own /analyze/single request"""
+    results = []
+    for text in texts:
+        response = session.post(URL + "/analyze/single", json={"text": text})
+        results.append(response.json() if response.status_code == 200 else None)
+    return results
+
+
+def bulk_call(session, texts):
+    """Analyze all texts with one /analyze/bulk request"""
+    response = session.post(URL + "/analyze/bulk", json={"texts": texts})
+    response.raise_for_status()
+    return [result if "error" not in result else None for result in response.json()["results"]]
+
+
+def main(csv_name, n_reviews):
+    df = pd.read_csv(config.CSV_DIR / csv_name, header=None, names=['reviewText', 'rating'])
+    texts = [str(text) for text in df['reviewText'].dropna().head(n_reviews)]
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=Path(__file__).parent.parent
+    )
+    try:
+        wait_for_server()
+        session = requests.Session()
+        # Load the models before measuring
+        single_calls(session, texts[:1])
+        bulk_call(session, texts[:1])
+
+        start = time.perf_counter()
+        single_results = single_calls(session, texts)
+        single_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bulk_results = bulk_call(session, texts)
+        bulk_seconds = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    fields = ["processed_text", "features", "classification", "summary"]
+    mismatches = sum(
+        (single is None) != (bulk is None) or
+        (single is not None and any(single[field] != bulk[field] for field in fields))
+        for single, bulk in zip(single_results, bulk_results)
+    )
+
+    print("=" * 60)
+    print(f"{len(texts)} reviews from {csv_name}")
+    print("=" * 60)
+    print(f"{'mode':<20}{'seconds':>10}{'reviews/sec':>14}")
+    print(f"{'single calls':<20}{single_seconds:>10.2f}{len(texts) / single_seconds:>14.0f}")
+    print(f"{'one bulk call':<20}{bulk_seconds:>10.2f}{len(texts) / bulk_seconds:>14.0f}")
+    print(f"speedup {single_seconds / bulk_seconds:.1f}x, {mismatches} mismatching results")
+
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else "poco_f1.csv",
+        int(sys.argv[2]) if len(sys.argv) > 2 else config.BULK_MAX_TEXTS
+    )
@@ -0,0 +1,57 @@
+"""
+Benchmark for the classification stage
+
+Compares scoring one sentence per model.predict call (batch_size=1, the old
+behaviour) with the chunked scoring used by classify() on the bundled csv_files.
+
+Usage:
+    python benchmarks/bench_classify.py [csv_name ...]
+"""
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+from analyzer import get_analyzer
+from preprocess import preprocess, construct_spacy_obj
+from feature_extraction import feature_extraction
+from classifiation import classify
+
+
+def time_classify(df, features, model, batch_size=None):
+    """Run classify once and return (seconds, results_df)"""
+    start = time.perf_counter()
+    results_df, _, _ = classify(df, features, model, batch_size=batch_size)
+    return time.perf_counter() - start, results_df
+
+
+def main(csv_names):
+    analyzer = get_analyzer("logistic_regression")
+
+    print("=" * 72)
+    print(f"{'file':<28}{'sentences':>10}{'per-sentence':>14}{'batched':>10}{'speedup':>10}")
+    print("=" * 72)
+
+    for name in csv_names:
+        df = pd.read_csv(config.CSV_DIR / name, header=None, names=['reviewText', 'rating'])
+        df = preprocess(df, analyzer.nlp)
+        df = construct_spacy_obj(df, analyzer.nlp)
+        features = feature_extraction(df, analyzer.ft_model, analyzer.nlp)
+
+        slow, slow_df = time_classify(df, features, analyzer.custom_model, batch_size=1)
+        fast, fast_df = time_classify(df, features, analyzer.custom_model)
+
+        # Batching must not change a single prediction
+        assert slow_df.equals(fast_df), f"Results differ for {name}"
+
+        print(f"{name:<28}{len(fast_df):>10}{slow:>13.2f}s{fast:>9.2f}s{slow / max(fast, 1e-9):>9.1f}x")
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or sorted(p.name for p in config.CSV_DIR.glob("*.csv") if p.name != "training.csv")
+    main(names)
@@ -0,0 +1,103 @@
+"""
+Memory benchmark for the pre-fork server
+
+Compares N independent processes that each load the analyzer (what running N
+separate uvicorn workers amounts to) with server.py, which loads it once and
+forks N workers sharing the model pages copy-on-write. Reports RSS and PSS
+(proportional set size, which splits shared pages between the processes using
+them) per worker and the total PSS of each setup.
+
+Usage:
+    python benchmarks/bench_prefork_memory.py [workers]
+"""
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+
+ROOT = Path(__file__).parent.parent
+PORT = 8768
+
+
+def memory_mb(pid):
+    """RSS and PSS of a process in MB (Linux)"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                values[name] = int(rest.split()[0]) / 1024
+    return values["Rss"], values["Pss"]
+
+
+def children_of(pid):
+    """Process ids of the direct children of a process"""
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def independent(workers):
+    """Start processes that each load the analyzer and return their pids"""
+    code = (
+        "import sys, time; sys.path.insert(0, '.'); "
+        "from analyzer import get_analyzer; get_analyzer(); print('ready', flush=True); time.sleep(3600)"
+    )
+    processes = [
+        subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        while process.stdout.readline().strip() != "ready":
+            pass
+    return processes, [process.pid for process in processes]
+
+
+def prefork(workers):
+    """Start server.py and return its process and the pids of its workers"""
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(PORT)],
+        cwd=ROOT, stdout=subprocess.DEVNULL
+    )
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{PORT}/health", timeout=1)
+            break
+        except requests.ConnectionError:
+            time.sleep(0.5)
+    # Let every worker finish starting up
+    time.sleep(2)
+    return [process], children_of(process.pid)
+
+
+def main(workers):
+    print("=" * 72)
+    print(f"{'mode':<14}{'workers':>8}{'RSS/worker':>14}{'PSS/worker':>14}{'total PSS':>12}")
+    print("=" * 72)
+
+    for mode, start in [("independent", independent), ("prefork", prefork)]:
+        processes, pids = start(workers)
+        try:
+            measured = [memory_mb(pid) for pid in pids]
+            total_pss = sum(pss for _, pss in measured)
+            if mode == "prefork":
+                # The parent holds the models too
+                total_pss += memory_mb(processes[0].pid)[1]
+            rss = sum(rss for rss, _ in measured) / len(measured)
+            pss = sum(pss for _, pss in measured) / len(measured)
+            print(f"{mode:<14}{len(pids):>8}{rss:>13.0f}M{pss:>13.0f}M{total_pss:>11.0f}M")
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else config.SERVER_WORKERS or 4)
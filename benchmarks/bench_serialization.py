@@ -0,0 +1,131 @@
+"""
+Benchmark for encoding a large /analyze/batch response
+
+Builds a batch result with one classification record per sentence of the bundled
+csv_files (repeated up to n_rows) and times how the API turns it into a response:
+
+- validated: FastAPI's default path, validating the result against
+  BatchAnalysisResponse, encoding it to JSON-compatible data and json.dumps
+- json: the result encoded straight away with json.dumps (no validation)
+- orjson: the result encoded straight away with orjson (FastJSONResponse)
+- fields=summary,features.*.total: the projected result encoded with orjson
+
+Usage:
+    python benchmarks/bench_serialization.py [n_rows] [repeats]
+"""
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from pydantic import TypeAdapter
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+import responses
+from api import BatchAnalysisResponse
+
+# Aspects of a typical phone review taxonomy, with some related words
+FEATURES = {
+    "battery": ["charge", "backup", "drain"],
+    "camera": ["photo", "lens", "selfie"],
+    "display": ["screen", "brightness"],
+    "performance": ["speed", "lag", "processor"],
+    "price": ["value", "cost"],
+    "sound": ["speaker", "audio"],
+    "design": ["look", "build"]
+}
+
+
+def build_result(n_rows):
+    """Build a batch result shaped like analyze_batch's from the bundled reviews"""
+    sentences = []
+    for path in sorted(config.CSV_DIR.glob("*.csv")):
+        df = pd.read_csv(path, header=None, names=['reviewText', 'rating'])
+        for text in df['reviewText'].dropna().astype(str):
+            sentences.extend(sentence.strip() for sentence in text.split(".") if len(sentence.strip()) > 3)
+    sentences = (sentences * (n_rows // max(len(sentences), 1) + 1))[:n_rows]
+
+    rng = random.Random(0)
+    classification = [
+        {"category": rng.choice(list(FEATURES)), "sentence": sentence, "sentiment": rng.choice(["Positive", "Negative"])}
+        for sentence in sentences
+    ]
+
+    features = {
+        feature: {"related": related, "positives": 0, "negatives": 0, "total": 0} for feature, related in FEATURES.items()
+    }
+    for row in classification:
+        counts = features[row["category"]]
+        counts["positives" if row["sentiment"] == "Positive" else "negatives"] += 1
+        counts["total"] += 1
+
+    positives = sum(counts["positives"] for counts in features.values())
+    return {
+        "summary": {
+            "total_reviews": n_rows,
+            "total_sentences": len(classification),
+            "positive_count": positives,
+            "negative_count": len(classification) - positives,
+            "features_found": len(features)
+        },
+        "features": features,
+        "classification": classification,
+        "partial": False,
+        "processed_reviews": n_rows
+    }
+
+
+def validated(result, adapter=TypeAdapter(BatchAnalysisResponse)):
+    """Encode the way FastAPI does for an endpoint returning a dict with a response_model"""
+    content = adapter.dump_python(adapter.validate_python(result), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def plain_json(result):
+    return json.dumps(result, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def projected(result, paths=("summary", "features.*.total")):
+    return responses.dumps(responses.project(result, list(paths)))
+
+
+def best_of(encode, result, repeats):
+    """Fastest of several runs (seconds) and the size of the encoded body"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        body = encode(result)
+        times.append(time.perf_counter() - start)
+    return min(times), len(body)
+
+
+def main(n_rows, repeats):
+    result = build_result(n_rows)
+    encoders = [("validated", validated), ("json", plain_json)]
+    if responses.ORJSON_AVAILABLE:
+        encoders.append(("orjson", responses.dumps))
+    encoders.append(("fields=summary,features.*.total", projected))
+
+    # Skipping validation must not change the response
+    assert json.loads(validated(result)) == json.loads(plain_json(result)) == json.loads(responses.dumps(result))
+
+    baseline = None
+    print("=" * 72)
+    print(f"{len(result['classification'])} classification rows, best of {repeats}")
+    print(f"{'encoding':<34}{'time':>10}{'size':>14}{'speedup':>12}")
+    print("=" * 72)
+    for name, encode in encoders:
+        seconds, size = best_of(encode, result, repeats)
+        baseline = baseline or seconds
+        print(f"{name:<34}{seconds * 1000:>8.2f}ms{size / 1024:>11.1f} KB{baseline / seconds:>11.1f}x")
+
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    main(n_rows, repeats)
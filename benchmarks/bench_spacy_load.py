@@ -0,0 +1,82 @@
+"""
+Benchmark for spaCy model loading
+
+Compares loading every en_core_web_sm component (the old behaviour) with loading
+only config.SPACY_COMPONENTS. Each configuration runs in a fresh interpreter and
+reports cold-start time, resident memory and parsing throughput on poco_f1.csv.
+
+Usage:
+    python benchmarks/bench_spacy_load.py
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def resident_memory_mb():
+    """Current resident set size of this process in MB (Linux)"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def measure(mode):
+    """Load the pipeline in the given mode and return the measurements"""
+    import spacy
+    import pandas as pd
+    import config
+    from analyzer import load_spacy_pipeline
+    from preprocess import preprocess, construct_spacy_obj
+
+    baseline = resident_memory_mb()
+    start = time.perf_counter()
+    if mode == "full":
+        nlp = spacy.load(config.SPACY_MODEL)
+    else:
+        nlp = load_spacy_pipeline()
+    if 'sentencizer' not in nlp.pipe_names:
+        nlp.add_pipe('sentencizer', last=True)
+    load_seconds = time.perf_counter() - start
+    loaded = resident_memory_mb()
+
+    df = pd.read_csv(config.CSV_DIR / "poco_f1.csv", header=None, names=['reviewText', 'rating'])
+    df = preprocess(df, nlp)
+    start = time.perf_counter()
+    construct_spacy_obj(df, nlp, n_process=1)
+    parse_seconds = time.perf_counter() - start
+
+    return {
+        "pipeline": nlp.pipe_names,
+        "load_seconds": load_seconds,
+        "model_mb": loaded - baseline,
+        "peak_mb": resident_memory_mb(),
+        "docs_per_sec": len(df) / parse_seconds,
+    }
+
+
+def main():
+    print("=" * 72)
+    print(f"{'mode':<10}{'load':>10}{'model MB':>12}{'RSS MB':>10}{'docs/sec':>12}  pipeline")
+    print("=" * 72)
+
+    for mode in ["full", "minimal"]:
+        output = subprocess.run(
+            [sys.executable, __file__, "--measure", mode],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<10}{result['load_seconds']:>9.2f}s{result['model_mb']:>12.1f}{result['peak_mb']:>10.1f}"
+              f"{result['docs_per_sec']:>12.0f}  {','.join(result['pipeline'])}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--measure":
+        print(json.dumps(measure(sys.argv[2])))
+    else:
+        main()
@@ -0,0 +1,54 @@
+"""
+Throughput benchmark for spaCy parsing in construct_spacy_obj
+
+Reports docs/sec for increasing n_process values on the bundled csv_files,
+along with the n_process/batch_size that pipe_settings() picks by default.
+
+Usage:
+    python benchmarks/bench_spacy_pipe.py [max_processes]
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+from analyzer import get_analyzer
+from preprocess import preprocess, construct_spacy_obj, pipe_settings
+
+CSV_FILES = ["poco_f1.csv", "galaxy-m20-critical.csv"]
+
+
+def main(max_processes):
+    nlp = get_analyzer("logistic_regression").nlp
+
+    process_counts = [1]
+    while process_counts[-1] * 2 <= max_processes:
+        process_counts.append(process_counts[-1] * 2)
+    if process_counts[-1] != max_processes:
+        process_counts.append(max_processes)
+
+    for name in CSV_FILES:
+        df = pd.read_csv(config.CSV_DIR / name, header=None, names=['reviewText', 'rating'])
+        df = preprocess(df, nlp)
+        default_n_process, batch_size = pipe_settings(df['reviewText'])
+
+        print("=" * 60)
+        print(f"{name}: {len(df)} reviews, default n_process={default_n_process}, batch_size={batch_size}")
+        print("=" * 60)
+        print(f"{'n_process':>10}{'seconds':>12}{'docs/sec':>12}")
+
+        for n_process in process_counts:
+            start = time.perf_counter()
+            construct_spacy_obj(df.copy(), nlp, n_process=n_process, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            print(f"{n_process:>10}{elapsed:>12.2f}{len(df) / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1)
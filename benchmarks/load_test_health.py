@@ -0,0 +1,116 @@
+"""
+Load test for /health latency while a batch upload is being analyzed
+
+Starts the API with uvicorn, polls /health at a steady rate while idle and then
+while CSV batches are uploaded to /analyze/batch, and reports /health latency
+percentiles for both phases. With analysis running off the event loop the two
+rows should be close.
+
+Usage:
+    python benchmarks/load_test_health.py [csv_name] [concurrent_uploads]
+"""
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import requests
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import config
+
+PORT = 8765
+URL = f"http://127.0.0.1:{PORT}"
+POLL_INTERVAL = 0.02
+
+
+def wait_for_server(timeout=120):
+    """Wait until the API answers"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(URL + "/health", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.5)
+    raise RuntimeError("API did not start")
+
+
+def poll_health(stop):
+    """Request /health until stop is set and return the latencies in ms"""
+    latencies = []
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        session.get(URL + "/health", timeout=60)
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(POLL_INTERVAL)
+    return latencies
+
+
+def upload(csv_path, statuses):
+    """Upload a CSV file for batch analysis"""
+    with open(csv_path, "rb") as f:
+        response = requests.post(URL + "/analyze/batch", files={"file": (csv_path.name, f, "text/csv")}, timeout=600)
+    statuses.append(response.status_code)
+
+
+def measure(uploads, csv_path):
+    """Poll /health while `uploads` batch uploads run (or for 5 seconds if none)"""
+    stop = threading.Event()
+    result = {}
+    poller = threading.Thread(target=lambda: result.setdefault("latencies", poll_health(stop)))
+    poller.start()
+
+    start = time.perf_counter()
+    statuses = []
+    if uploads:
+        threads = [threading.Thread(target=upload, args=(csv_path, statuses)) for _ in range(uploads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        time.sleep(5)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    poller.join()
+    return result["latencies"], elapsed, statuses
+
+
+def main(csv_name, uploads):
+    csv_path = config.CSV_DIR / csv_name
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=Path(__file__).parent.parent
+    )
+    try:
+        wait_for_server()
+        # Load the models before measuring
+        upload(csv_path, [])
+
+        print("=" * 72)
+        print(f"{'phase':<24}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>8}")
+        print("=" * 72)
+
+        for phase, count in [("idle", 0), (f"{uploads} x {csv_name}", uploads)]:
+            latencies, elapsed, statuses = measure(count, csv_path)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            print(f"{phase:<24}{len(latencies):>10}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{max(latencies):>8.0f}")
+            if statuses:
+                print(f"{'':<24}batch took {elapsed:.1f}s, status codes {statuses}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else "galaxy-m20-critical.csv",
+        int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    )
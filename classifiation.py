@@ -1,4 +1,6 @@
 import pandas as pd
+from collections import OrderedDict
+import config
 from feature_extraction import feature_extraction
 
 # Creating a lookup table so that related feature maps to its coresponding main feature
@@ -14,19 +16,56 @@ def construct_rev_lookup(features):
 					
 	return bucket_lookup
 
-def classify(df, features, model):
+# Keeping only those features (along with their related features) that are mentioned in the reviews.
+# Used when a precomputed taxonomy is the lookup, so that unrelated features are not reported.
+def features_in_reviews(df, features):
+	lookup = construct_rev_lookup(features)
+	mentioned = set()
+
+	for review in df['spacyObj']:
+		for token in review:
+			if token.text in lookup:
+				mentioned.add(lookup[token.text])
+
+	return OrderedDict((feature, related) for feature, related in features.items() if feature in mentioned)
+
+# Predicting sentiments chunk by chunk so that the whole Pipeline (tfidf + lr) runs
+# once per chunk instead of once per sentence
+def predict_sentences(model, sentences, batch_size=None, cache=None):
+	if batch_size is None:
+		batch_size = config.CLASSIFY_BATCH_SIZE
+
+	if cache is None:
+		predictions = []
+		for start in range(0, len(sentences), batch_size):
+			predictions.extend(model.predict(sentences[start:start + batch_size]))
+
+		return predictions
+
+	# With a cache only the sentences that were never seen before are predicted, each of them once
+	known = cache.get_many(sentences, model)
+	missing = list(OrderedDict.fromkeys(sentence for sentence in sentences if sentence not in known))
+
+	new_predictions = predict_sentences(model, missing, batch_size)
+	cache.put_many(dict(zip(missing, new_predictions)), model)
+	known.update(zip(missing, new_predictions))
+
+	return [known[sentence] for sentence in sentences]
+
+# Collecting the sentences that mention exactly one feature, along with that feature and the review they came from
+def categorize_sentences(df, features):
 	lookup = construct_rev_lookup(features)
 
 	invalid_pos = set(['PRON', 'AUX', 'DET'])
 
 	features = []
 	sentences = []
-	sentiments = []
+	review_ids = []
 	
 	no_cat_sents = []
 	more_than_one_sents = []
 	
-	for review in df['spacyObj']:
+	for review_id, review in df['spacyObj'].items():
 		for sent in review.sents:
 			
 			# lets check if the sentence contains more than one noun/adjective
@@ -60,17 +99,43 @@ def classify(df, features, model):
 				flag = False
 				no_cat_sents.append(sent.text)
 
-			# Here the sentiment of the sentence is predicted with the logistic regression model
-			# that was loaded when the server was started
+			# Now we know the sentence contains only one feature, so it is kept for prediction
 			if flag:
-				# Now we know the sentence contains only one feature and find sentiment of that
-				pred = model.predict([sent.text])[0]
 				features.append(cat)
 				sentences.append(sent.text)
-				sentiments.append(pred)
+				review_ids.append(review_id)
+
+	return features, sentences, review_ids, more_than_one_sents, no_cat_sents
+
+def classify(df, features, model, batch_size=None, cache=None):
+	features, sentences, review_ids, more_than_one_sents, no_cat_sents = categorize_sentences(df, features)
+
+	# Here the sentiment of all the collected sentences is predicted with the logistic regression
+	# model that was loaded when the server was started
+	sentiments = predict_sentences(model, sentences, batch_size, cache)
 				
-	results_df = pd.DataFrame({'category': features, 'sentence': sentences, 'sentiment': sentiments})
+	# results are indexed by the review each sentence came from
+	results_df = pd.DataFrame({'category': features, 'sentence': sentences, 'sentiment': sentiments}, index=review_ids)
 	no_cat_df = pd.DataFrame({'sentence': no_cat_sents})
 	more_than_one_df = pd.DataFrame({'sentences': more_than_one_sents})
 	
-	return results_df, more_than_one_df, no_cat_df
\ No newline at end of file
+	return results_df, more_than_one_df, no_cat_df
+
+# Fanning the results of deduplicated reviews back out, so that every original review gets the
+# rows of its representative. representatives maps each original review to its representative review.
+def expand_duplicates(results_df, representatives):
+	positions = {}
+	for position, review_id in enumerate(results_df.index):
+		positions.setdefault(review_id, []).append(position)
+
+	take = []
+	review_ids = []
+	for review_id, representative in representatives.items():
+		for position in positions.get(representative, []):
+			take.append(position)
+			review_ids.append(review_id)
+
+	expanded_df = results_df.iloc[take]
+	expanded_df.index = review_ids
+
+	return expanded_df
@@ -23,6 +23,9 @@ TRAINING_DATA = CSV_DIR / "training.csv"
 
 # Database
 DB_PATH = BASE_DIR / "feedback.db"
+# Queue of /jobs batch analyses, kept with the uploaded CSVs and results in JOBS_DIR
+JOBS_DIR = Path(os.getenv("JOBS_DIR", str(BASE_DIR / "jobs")))
+JOBS_DB_PATH = Path(os.getenv("JOBS_DB_PATH", str(JOBS_DIR / "jobs.db")))
 
 # Model Settings (with environment variable overrides)
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "logistic_regression")
@@ -36,6 +39,40 @@ CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", "0.6"))
 TOP_FEATURES_PERCENT = 0.05  # Top 5% of features
 SIMILARITY_THRESHOLD = 0.64
 ASSOCIATION_CONFIDENCE = 0.4
+TAXONOMY_PATH = MODELS_DIR / "taxonomy.joblib"
+# Batches up to this size use the precomputed taxonomy instead of extracting their own features
+SMALL_BATCH_MAX_REVIEWS = int(os.getenv("SMALL_BATCH_MAX_REVIEWS", "50"))
+
+# spaCy Pipeline
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+# Only these components of the spaCy model are loaded, the rest are excluded.
+# attribute_ruler is needed since it maps the tagger's tags to the POS tags used in feature extraction.
+SPACY_COMPONENTS = [
+    name.strip() for name in os.getenv("SPACY_COMPONENTS", "tok2vec,tagger,attribute_ruler").split(",") if name.strip()
+]
+
+# spaCy Parsing Settings
+# Worker processes for nlp.pipe (0 = one per CPU core), only used when every worker gets
+# at least SPACY_MIN_REVIEWS_PER_PROCESS reviews since starting a worker has a fixed cost.
+# API, batch and job workers already run side by side, so they parse in a single process
+SPACY_N_PROCESS = int(os.getenv("SPACY_N_PROCESS", "1"))
+# Worker processes for nlp.pipe when parsing the training data (0 = one per CPU core)
+SPACY_TRAIN_N_PROCESS = int(os.getenv("SPACY_TRAIN_N_PROCESS", "0"))
+SPACY_MIN_REVIEWS_PER_PROCESS = int(os.getenv("SPACY_MIN_REVIEWS_PER_PROCESS", "2000"))
+# Batch size for nlp.pipe is derived from the average review length to keep batches near this many characters
+SPACY_BATCH_CHARS = int(os.getenv("SPACY_BATCH_CHARS", "50000"))
+
+# Normalize and parse reviews in a single nlp.pipe pass instead of tokenizing them twice
+FUSED_PREPROCESSING = os.getenv("FUSED_PREPROCESSING", "False").lower() == "true"
+
+# Analyze only one copy of identical reviews in a batch and count the results for every copy
+DEDUPLICATE_REVIEWS = os.getenv("DEDUPLICATE_REVIEWS", "True").lower() == "true"
+
+# Reviews per chunk when a batch is analyzed incrementally (analyze_batch_iter)
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "500"))
+
+# Classification Settings
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "2048"))  # Sentences per model.predict call
 
 # Stopwords and preprocessing
 STOPWORDS_ENABLED = True
@@ -53,18 +90,92 @@ THEME = {
 
 # Export Settings
 EXPORT_FORMATS = ["CSV", "JSON", "PDF"]
-MAX_UPLOAD_SIZE_MB = 200
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "200"))  # Larger API requests are rejected with 413
 
 # Performance
 ENABLE_CACHING = os.getenv("ENABLE_CACHING", "True").lower() == "true"
 CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))  # 1 hour
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "100000"))  # Sentences kept in the prediction cache
 
 # API Settings
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8000"))
+# Worker processes forked by the pre-fork server (server.py), 0 = one per CPU core
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))
+# Directory where the pre-fork workers write their metrics for /metrics to merge
+# (empty = a temporary one made by server.py), and how often each worker rewrites its file
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_SYNC_SECONDS = float(os.getenv("METRICS_SYNC_SECONDS", "1"))
+# Load the default model and run sample reviews through it at startup (/ready fails until done)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "True").lower() == "true"
 API_TITLE = "Sentiment Analysis API"
 API_VERSION = "1.0.0"
 
+# API Executors
+# Threads for blocking I/O (reading uploads, the job database) off the event loop
+API_THREAD_WORKERS = int(os.getenv("API_THREAD_WORKERS", "4"))
+# Processes running batch analyses (0 = run them in the scheduler's batch class instead)
+API_PROCESS_WORKERS = int(os.getenv("API_PROCESS_WORKERS", "2"))
+# How the batch processes are started. Forking the multi-threaded API process can copy a lock
+# another thread held (e.g. the analyzer lock during a model load, torch's thread pools) into
+# the child and hang it, so by default they start a fresh interpreter and load the models there
+API_PROCESS_START_METHOD = os.getenv("API_PROCESS_START_METHOD", "spawn")
+# Niceness added to the batch processes (process pool and jobs), so single reviews win the CPU
+BATCH_NICENESS = int(os.getenv("BATCH_NICENESS", "10"))
+# Priority scheduler running analyses in the API process. Each class (endpoint group)
+# has threads of its own and a weight for its share of the shared threads.
+SCHEDULER_SHARED_WORKERS = int(os.getenv("SCHEDULER_SHARED_WORKERS", "2"))
+SCHEDULER_CLASSES = {
+    # class: (weight, dedicated threads)
+    "single": (int(os.getenv("SCHEDULER_SINGLE_WEIGHT", "8")), int(os.getenv("SCHEDULER_SINGLE_WORKERS", "2"))),
+    "batch": (int(os.getenv("SCHEDULER_BATCH_WEIGHT", "2")), int(os.getenv("SCHEDULER_BATCH_WORKERS", "1"))),
+    "explain": (int(os.getenv("SCHEDULER_EXPLAIN_WEIGHT", "1")), int(os.getenv("SCHEDULER_EXPLAIN_WORKERS", "1")))
+}
+# Requests of each endpoint group analyzed at once, the rest wait their turn
+API_SINGLE_CONCURRENCY = int(os.getenv("API_SINGLE_CONCURRENCY", "16"))
+API_BATCH_CONCURRENCY = int(os.getenv("API_BATCH_CONCURRENCY", "2"))
+API_EXPLAIN_CONCURRENCY = int(os.getenv("API_EXPLAIN_CONCURRENCY", "2"))
+
+# Admission control: requests beyond an endpoint group's budget of outstanding (running or
+# queued) requests get 429, and every request gets 503 while the process is over
+# ADMISSION_MAX_RSS_MB of resident memory (0 disables either limit). Budgets are per API
+# process, so each pre-fork worker (SERVER_WORKERS) has its own
+ADMISSION_MAX_SINGLE = int(os.getenv("ADMISSION_MAX_SINGLE", "512"))
+ADMISSION_MAX_BATCH = int(os.getenv("ADMISSION_MAX_BATCH", "8"))
+ADMISSION_MAX_EXPLAIN = int(os.getenv("ADMISSION_MAX_EXPLAIN", "8"))
+ADMISSION_MAX_RSS_MB = float(os.getenv("ADMISSION_MAX_RSS_MB", "0"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))  # Seconds, sent as Retry-After
+
+# Concurrent /analyze/single requests are analyzed together: a batch runs once it has
+# MICROBATCH_MAX_SIZE reviews or MICROBATCH_WINDOW_MS after its first review arrived
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "True").lower() == "true"
+MICROBATCH_WINDOW_MS = float(os.getenv("MICROBATCH_WINDOW_MS", "5"))
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "64"))
+# Concurrent identical /analyze/single and /analyze/batch requests (same text or CSV and
+# model type) share one analysis instead of each running it
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "True").lower() == "true"
+# Maximum texts in one /analyze/bulk request
+BULK_MAX_TEXTS = int(os.getenv("BULK_MAX_TEXTS", "1000"))
+# Reviews of one /ws/analyze connection analyzed or awaiting sending at once, the socket isn't read beyond that
+WEBSOCKET_MAX_PENDING = int(os.getenv("WEBSOCKET_MAX_PENDING", "128"))
+
+# Batch Jobs
+# Jobs run at once, each by a job process that loads the models once and runs one job after
+# the other (0 = only accept jobs). Under the pre-fork server a single job runner process runs
+# them for every worker
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# POST /jobs is rejected with 429 while this many jobs are queued
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+# Running jobs record a heartbeat this often and are requeued once it is JOB_STALE_SECONDS old
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "5"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "30"))
+# A job still running after this long is stopped and failed (0 = no limit)
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "3600"))
+# How job processes are started. They are started from a thread of the multi-threaded API
+# process, where a forked child can inherit a lock another thread held (e.g. the analyzer
+# lock during a model load) and hang, so by default they start a fresh interpreter
+JOB_START_METHOD = os.getenv("JOB_START_METHOD", "spawn")
+
 # Explainability
 ENABLE_SHAP = os.getenv("ENABLE_SHAP", "True").lower() == "true"
 ENABLE_LIME = os.getenv("ENABLE_LIME", "True").lower() == "true"
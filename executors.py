@@ -0,0 +1,408 @@
+"""
+Executors that run CPU-bound analysis off the API's event loop
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import config
+import metrics
+
+_thread_pool = None
+_process_pool = None
+_scheduler = None
+_pool_lock = threading.Lock()
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """Get or create the thread pool for blocking I/O"""
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=config.API_THREAD_WORKERS, thread_name_prefix="io"
+            )
+        return _thread_pool
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Get or create the process pool for batch analyses"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            # Workers load the default model as they start, unless models are only loaded when needed
+            model_type = config.DEFAULT_MODEL if config.WARMUP_ON_STARTUP else None
+            _process_pool = ProcessPoolExecutor(
+                max_workers=config.API_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context(config.API_PROCESS_START_METHOD),
+                initializer=init_batch_process, initargs=(model_type,)
+            )
+        return _process_pool
+
+
+def get_scheduler() -> "PriorityScheduler":
+    """Get or create the scheduler for analyses run in the API process"""
+    global _scheduler
+    with _pool_lock:
+        if _scheduler is None:
+            _scheduler = PriorityScheduler(config.SCHEDULER_CLASSES, config.SCHEDULER_SHARED_WORKERS)
+        return _scheduler
+
+
+def init_batch_process(model_type: Optional[str] = None):
+    """
+    Prepare a batch process started by the API process (runs in each new pool worker and job process)
+
+    Args:
+        model_type: Optional model type to load and warm up before the first call
+    """
+    # The server's handlers only flag its event loop, which doesn't run here, so
+    # the worker would ignore SIGTERM. Ctrl+C is handled by the API process.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Give up the CPU to the API process's single review analyses
+    if config.BATCH_NICENESS:
+        os.nice(config.BATCH_NICENESS)
+
+    if model_type is not None:
+        from analyzer import get_analyzer
+        get_analyzer(model_type).warmup()
+
+
+async def run_scheduled(workload: str, func, *args, **kwargs):
+    """
+    Run an analysis on the scheduler's threads without blocking the event loop
+
+    Args:
+        workload: Scheduler class (single, batch or explain)
+        func: Function to call
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        Return value of func
+    """
+    return await asyncio.wrap_future(get_scheduler().submit(workload, partial(func, *args, **kwargs)))
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Run a blocking function in the I/O thread pool without blocking the event loop
+
+    Args:
+        func: Function to call
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        Return value of func
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_thread_pool(), partial(func, *args, **kwargs))
+
+
+async def run_in_process(func, *args, **kwargs):
+    """
+    Run a module-level function in the process pool without blocking the event loop
+
+    Falls back to the scheduler's batch class when API_PROCESS_WORKERS is 0. A pool whose
+    worker died (e.g. killed for running out of memory) is replaced so the next
+    call gets fresh workers.
+
+    Args:
+        func: Picklable function to call
+        *args: Picklable positional arguments for func
+        **kwargs: Picklable keyword arguments for func
+
+    Returns:
+        Return value of func
+    """
+    global _process_pool
+    if config.API_PROCESS_WORKERS <= 0:
+        return await run_scheduled("batch", func, *args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    try:
+        result, updates = await loop.run_in_executor(pool, partial(_call_with_metrics, func, args, kwargs))
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _process_pool is pool:
+                _process_pool = None
+        pool.shutdown(wait=False)
+        raise
+
+    # Metrics recorded in the worker process are added to this process's metrics
+    metrics.replay(updates)
+    return result
+
+
+def _call_with_metrics(func, args, kwargs):
+    """Call a function in a pool worker and return its result with the metric updates it made"""
+    with metrics.capture() as updates:
+        result = func(*args, **kwargs)
+    return result, updates
+
+
+def shutdown():
+    """Shut down the pools and the scheduler (called when the API stops)"""
+    global _thread_pool, _process_pool, _scheduler
+    with _pool_lock:
+        thread_pool, process_pool, scheduler = _thread_pool, _process_pool, _scheduler
+        _thread_pool = None
+        _process_pool = None
+        _scheduler = None
+    if thread_pool is not None:
+        thread_pool.shutdown(wait=False, cancel_futures=True)
+    if scheduler is not None:
+        scheduler.shutdown()
+    if process_pool is not None:
+        # Wait for the workers to exit: uvicorn re-raises the stop signal after
+        # shutdown, which ends this process before a background shutdown could
+        # tell them to stop, leaving them orphaned
+        process_pool.shutdown(wait=True, cancel_futures=True)
+
+
+class PriorityScheduler:
+    """
+    Thread pool that runs calls by priority class
+
+    Every class has a queue, dedicated threads that only run its calls, and a
+    weight. The shared threads serve the classes by weighted fair queuing: each
+    class has a virtual time that advances by 1/weight for every call a shared
+    thread starts, and the waiting class with the smallest one goes next. Under
+    contention a class gets shared threads in proportion to its weight, and its
+    dedicated threads keep serving it however busy the others are.
+    """
+
+    def __init__(self, classes: Dict[str, Tuple[int, int]], shared_workers: int):
+        """
+        Initialize scheduler
+
+        Args:
+            classes: Weight and number of dedicated threads of each class
+            shared_workers: Number of threads shared by all classes
+        """
+        self.weights = {name: max(weight, 1) for name, (weight, _) in classes.items()}
+        self._queues = {name: deque() for name in classes}
+        self._virtual_time = {name: 0.0 for name in classes}
+        self._clock = 0.0
+        self._running = {name: 0 for name in classes}
+        self._condition = threading.Condition()
+        self._stopping = False
+
+        self._threads = []
+        for name, (_, dedicated) in classes.items():
+            for i in range(dedicated):
+                self._start_thread(name, f"analysis-{name}-{i}")
+        for i in range(shared_workers):
+            self._start_thread(None, f"analysis-shared-{i}")
+
+    def _start_thread(self, workload: Optional[str], name: str):
+        thread = threading.Thread(target=self._work, args=(workload,), name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, workload: str, func) -> Future:
+        """
+        Queue a call
+
+        Args:
+            workload: Class of the call
+            func: Function to call without arguments
+
+        Returns:
+            Future of the call's result
+        """
+        future = Future()
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Scheduler is shut down")
+            queue = self._queues[workload]
+            if not queue:
+                # A class that was idle doesn't get credit for the time it didn't use
+                self._virtual_time[workload] = max(self._virtual_time[workload], self._clock)
+            queue.append((future, func, time.perf_counter()))
+            self._condition.notify_all()
+        return future
+
+    def _next(self, workload: Optional[str]) -> Optional[str]:
+        """Class whose call a thread serving workload (None = shared) should run next"""
+        if workload is not None:
+            return workload if self._queues[workload] else None
+
+        waiting = [name for name, queue in self._queues.items() if queue]
+        if not waiting:
+            return None
+        return min(waiting, key=lambda name: (self._virtual_time[name], -self.weights[name]))
+
+    def _work(self, workload: Optional[str]):
+        """Run queued calls until shut down (scheduler thread)"""
+        while True:
+            with self._condition:
+                name = self._next(workload)
+                while name is None and not self._stopping:
+                    self._condition.wait()
+                    name = self._next(workload)
+                if name is None:
+                    return
+
+                future, func, queued_at = self._queues[name].popleft()
+                if workload is None:
+                    self._clock = self._virtual_time[name]
+                    self._virtual_time[name] += 1 / self.weights[name]
+                self._running[name] += 1
+
+            try:
+                metrics.SCHEDULER_WAIT_SECONDS.observe(time.perf_counter() - queued_at, workload=name)
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(func())
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._running[name] -= 1
+
+    def stats(self) -> Dict:
+        """
+        Get scheduler statistics
+
+        Returns:
+            Dictionary with the queued and running calls of each class
+        """
+        with self._condition:
+            return {
+                name: {"queued": len(queue), "running": self._running[name]}
+                for name, queue in self._queues.items()
+            }
+
+    def shutdown(self):
+        """Cancel the queued calls and stop the threads once their current call returns"""
+        with self._condition:
+            self._stopping = True
+            for queue in self._queues.values():
+                while queue:
+                    queue.popleft()[0].cancel()
+            self._condition.notify_all()
+
+
+class ConcurrencyLimiter:
+    """
+    Caps how many requests of an endpoint group are analyzed at once
+
+    Used as `async with limiter:`. Requests over the limit wait for a slot.
+    """
+
+    def __init__(self, name: str, limit: int):
+        """
+        Initialize limiter
+
+        Args:
+            name: Endpoint group name
+            limit: Maximum requests analyzed at once
+        """
+        self.name = name
+        self.limit = limit
+        self._semaphore = None
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict:
+        """
+        Get limiter statistics
+
+        Returns:
+            Dictionary with the limit and in-flight, waiting and completed counts
+        """
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed
+        }
+
+
+limiters = {
+    "single": ConcurrencyLimiter("single", config.API_SINGLE_CONCURRENCY),
+    "batch": ConcurrencyLimiter("batch", config.API_BATCH_CONCURRENCY),
+    "explain": ConcurrencyLimiter("explain", config.API_EXPLAIN_CONCURRENCY)
+}
+
+
+def analyze_batch(df: pd.DataFrame, model_type: str, deadline: Optional[float] = None) -> Dict:
+    """
+    Analyze a batch of reviews (runs inside a pool worker)
+
+    Args:
+        df: DataFrame with 'reviewText' and 'rating' columns
+        model_type: Model type to use
+        deadline: Optional time.time() by which to stop and return the partial results
+
+    Returns:
+        Batch analysis results
+    """
+    from analyzer import get_analyzer
+    analyzer = get_analyzer(model_type)
+    if deadline is None:
+        return analyzer.analyze_batch(df)
+    return analyzer.analyze_batch_within(df, deadline)
+
+
+def analyze_texts(texts: List[str], ids: Optional[List], model_type: str) -> List[Dict]:
+    """
+    Analyze many review texts independently (runs inside a pool worker)
+
+    Args:
+        texts: Review texts
+        ids: Optional ids returned with the results
+        model_type: Model type to use
+
+    Returns:
+        List of analysis results in the order of texts
+    """
+    from analyzer import get_analyzer
+    return get_analyzer(model_type).analyze_texts(texts, ids, model_type)
+
+
+def warmup(model_type: str) -> float:
+    """
+    Load and warm up the analyzer (runs inside a pool worker)
+
+    Args:
+        model_type: Model type to use
+
+    Returns:
+        Seconds taken (0 if the worker's initializer already warmed it up)
+    """
+    from analyzer import get_analyzer
+    return get_analyzer(model_type).warmup()
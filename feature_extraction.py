@@ -3,23 +3,47 @@ import pandas as pd
 import re
 from spellchecker import SpellChecker
 from spacy.matcher import Matcher
-from collections import OrderedDict
-from sklearn.metrics.pairwise import cosine_similarity
+from collections import Counter, OrderedDict
+from sklearn.preprocessing import normalize
+
+# Fetching each word vector only once and computing all the pairwise cosine similarities
+# with a single matrix product (rows are normalized, so the dot product is the cosine similarity)
+def similarity_matrix(words, ft_model):
+    if len(words) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    vectors = normalize(np.vstack([ft_model.get_word_vector(word) for word in words]))
+    return vectors @ vectors.T
+
+# Counts sorted in descending order like value_counts() of the repeated items, ties
+# staying in the order they were first seen
+def sorted_counts(counts):
+    return pd.Series(counts, dtype='int64').sort_values(ascending=False, kind='stable')
+
+def feature_extraction(df, ft_model, nlp, weights=None):    
+    # weights (optional) holds how many times each review occurs in the corpus when
+    # duplicate reviews were collapsed, so that nouns are counted as if every copy was there
+    all_nouns, noun_phrases = count_nouns(df, nlp, weights)
+
+    return features_from_counts(all_nouns, noun_phrases, ft_model)
+
+def count_nouns(df, nlp, weights=None, all_nouns=None, noun_phrases=None):
+    # Counting the nouns and noun phrases of parsed reviews. Counts of earlier reviews can be
+    # passed in to add to them, so a corpus can be counted part by part without keeping every
+    # part's spacy objects, the counts only depend on the nouns and their order of appearance.
 
-def feature_extraction(df, ft_model, nlp):    
     # Extracting all the single nouns in the corpus
-    all_nouns = []
+    if all_nouns is None:
+        all_nouns = Counter()
 
-    for review in df['spacyObj']:
+    for i, review in df['spacyObj'].items():
+        weight = 1 if weights is None else weights[i]
         for token in review:
             if token.pos_ == "NOUN":
-                all_nouns.append(token.text)
-        
-    all_nouns = pd.Series(all_nouns)
-    # Finding unique nouns along with their counts sorted in descending order
-    unique_nouns = all_nouns.value_counts()
+                all_nouns[token.text] += weight
 
-    noun_phrases = []
+    if noun_phrases is None:
+        noun_phrases = Counter()
     
     # Pattern to match i.e. two nouns occuring together
     patterns = [
@@ -29,14 +53,19 @@ def feature_extraction(df, ft_model, nlp):
     matcher = Matcher(nlp.vocab)
     matcher.add('NounPhrasees', patterns)
 
-    for review in df['spacyObj']:
+    for i, review in df['spacyObj'].items():
+        weight = 1 if weights is None else weights[i]
         matches = matcher(review)
 
         for match_id, start, end in matches:
-            noun_phrases.append(review[start:end].text)
-            
-    noun_phrases = pd.Series(noun_phrases)
-    unique_noun_phrases = noun_phrases.value_counts()
+            noun_phrases[review[start:end].text] += weight
+
+    return all_nouns, noun_phrases
+
+def features_from_counts(all_nouns, noun_phrases, ft_model):
+    # Finding unique nouns along with their counts sorted in descending order
+    unique_nouns = sorted_counts(all_nouns)
+    unique_noun_phrases = sorted_counts(noun_phrases)
             
     # Remove nouns with single or double character
     for noun in unique_nouns.index:
@@ -57,6 +86,10 @@ def feature_extraction(df, ft_model, nlp):
     top_features_list = list(top_features.keys())
     top_features_set = set(top_features.keys())
     unique_noun_phrases_set = set(unique_noun_phrases.keys())
+
+    # pairwise similarities of all the candidate features, every similarity check below is a lookup in it
+    similarities = similarity_matrix(top_features_list, ft_model)
+    feature_index = {feature: i for i, feature in enumerate(top_features_list)}
     
     # Applying assocation rule mining to group nouns occuring together
     for feature1 in top_features_list:
@@ -111,9 +144,8 @@ def feature_extraction(df, ft_model, nlp):
     for feature1 in top_features_list[:20]:
         for feature2 in main_features:
             if feature1 not in features_bucket and feature1 in top_features_set:
-                similarity =  cosine_similarity(ft_model.get_word_vector(feature1).reshape(1, -1), 
-                                                   ft_model.get_word_vector(feature2).reshape(1, -1))
-                if similarity[0][0] > 0.64:
+                similarity = similarities[feature_index[feature1], feature_index[feature2]]
+                if similarity > 0.64:
                     top_features_to_add.discard(feature1)
 
             else:
@@ -125,9 +157,8 @@ def feature_extraction(df, ft_model, nlp):
     for feature1 in top_features_to_add_list:
         for feature2 in top_features_to_add_list:
             if feature1 in top_features_to_add and feature2 in top_features_to_add:
-                similarity =  cosine_similarity(ft_model.get_word_vector(feature1).reshape(1, -1), 
-                                                   ft_model.get_word_vector(feature2).reshape(1, -1))
-                if similarity[0][0] < 0.99 and similarity[0][0] > 0.64:
+                similarity = similarities[feature_index[feature1], feature_index[feature2]]
+                if similarity < 0.99 and similarity > 0.64:
                     feature_to_remove = min((unique_nouns[feature1], feature1), (unique_nouns[feature2], feature2))[1]
                     top_features_to_add.remove(feature_to_remove)
 
@@ -148,11 +179,10 @@ def feature_extraction(df, ft_model, nlp):
 
         for feature1 in main_features:
             if feature2 in top_features_set:
-                similarity =  cosine_similarity(ft_model.get_word_vector(feature1).reshape(1, -1), 
-                                               ft_model.get_word_vector(feature2).reshape(1, -1))
-                if similarity[0][0] <= 0.99 and similarity[0][0] > 0.62:
-                    if similarity[0][0] > best_similarity:
-                        best_similarity = similarity[0][0]
+                similarity = similarities[feature_index[feature1], feature_index[feature2]]
+                if similarity <= 0.99 and similarity > 0.62:
+                    if similarity > best_similarity:
+                        best_similarity = similarity
                         most_matching_main_feature = feature1
 
         if best_similarity != 0 and most_matching_main_feature != "":       
@@ -0,0 +1,445 @@
+"""
+Persistent queue of batch analysis jobs
+
+Jobs are kept in a SQLite database next to their uploaded CSV and result files,
+so queued jobs survive an API restart. Runner threads claim queued jobs and run
+them in a job process of their own, which loads the analyzer once and then runs
+one job after the other; it is only replaced when a job crashes it or has to be
+stopped. While a job runs, its runner keeps a heartbeat in the database. A running job whose heartbeat stops (its API process died) is put back
+in the queue by whichever runner claims a job next. A job that runs longer than
+JOB_TIMEOUT_SECONDS is stopped and failed.
+"""
+import multiprocessing
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import config
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of batch analysis jobs and the threads that run them
+    """
+
+    def __init__(self, db_path: Path = config.JOBS_DB_PATH, jobs_dir: Path = config.JOBS_DIR,
+                 workers: int = config.JOB_WORKERS, start_method: str = config.JOB_START_METHOD):
+        """
+        Initialize queue
+
+        Args:
+            db_path: SQLite database file
+            jobs_dir: Directory of the uploaded CSVs and results
+            workers: Jobs run at once by this process (0 = only queue them)
+            start_method: multiprocessing start method of the job processes
+        """
+        self.db_path = Path(db_path)
+        self.jobs_dir = Path(jobs_dir)
+        self.workers = workers
+        self.context = multiprocessing.get_context(start_method)
+        # Job processes started so far, each loads the models
+        self.processes_started = 0
+
+        self._schema_ready = False
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection, creating the database on first use"""
+        if not self._schema_ready:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._schema_ready:
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        status TEXT NOT NULL,
+                        model_type TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        started_at REAL,
+                        finished_at REAL,
+                        heartbeat_at REAL,
+                        processed REAL DEFAULT 0,
+                        total INTEGER,
+                        message TEXT,
+                        error TEXT,
+                        cancel_requested INTEGER DEFAULT 0
+                    )
+                ''')
+                conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            self._schema_ready = True
+        return conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """Run a statement in its own transaction and return the rows it produced"""
+        with closing(self._connect()) as conn:
+            with conn:
+                return conn.execute(sql, params).fetchall()
+
+    def input_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.csv"
+
+    def result_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def submit(self, file, model_type: str) -> Dict:
+        """
+        Store an uploaded CSV and queue a job for it
+
+        Args:
+            file: File object of a CSV file with reviewText and rating columns
+            model_type: Model type to use
+
+        Returns:
+            The queued job
+        """
+        job_id = uuid.uuid4().hex
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.input_path(job_id), "wb") as f:
+            shutil.copyfileobj(file, f)
+
+        self._execute(
+            "INSERT INTO jobs (id, status, model_type, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, QUEUED, model_type, time.time())
+        )
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Get a job
+
+        Args:
+            job_id: Job id
+
+        Returns:
+            Job status and progress, or None if there is no such job
+        """
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+
+        job = dict(rows[0])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["progress"] = round(job["processed"] / job["total"], 4) if job["total"] else 0.0
+        return job
+
+    def count(self, status: str) -> int:
+        """Number of jobs with a status"""
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,))[0][0]
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """
+        Cancel a job
+
+        A queued job is cancelled right away. A running job is stopped by its
+        runner within JOB_HEARTBEAT_SECONDS.
+
+        Args:
+            job_id: Job id
+
+        Returns:
+            The job, or None if there is no such job
+        """
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, now, job_id, QUEUED)
+        )
+        self._execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING))
+        return self.get(job_id)
+
+    def delete(self, job_id: str):
+        """
+        Delete a finished job and its files
+
+        Args:
+            job_id: Job id
+        """
+        self._execute("DELETE FROM jobs WHERE id = ? AND status IN (?, ?, ?)", (job_id, *FINISHED))
+        self.input_path(job_id).unlink(missing_ok=True)
+        self.result_path(job_id).unlink(missing_ok=True)
+
+    def update_progress(self, job_id: str, processed: float, total: int, message: str):
+        """Record the progress reported by analyze_batch"""
+        self._execute(
+            "UPDATE jobs SET processed = ?, total = ?, message = ? WHERE id = ?",
+            (processed, total, message, job_id)
+        )
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None):
+        """Mark a running job completed, failed or cancelled"""
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?",
+            (status, error, time.time(), job_id, RUNNING)
+        )
+
+    def requeue_stale(self) -> int:
+        """
+        Put running jobs whose heartbeat stopped back in the queue
+
+        Those that were asked to be cancelled are cancelled instead.
+
+        Returns:
+            Number of requeued jobs
+        """
+        now = time.time()
+        stale = now - config.JOB_STALE_SECONDS
+        self._execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE status = ? AND heartbeat_at < ? AND cancel_requested = 1",
+            (CANCELLED, now, RUNNING, stale)
+        )
+        rows = self._execute(
+            "UPDATE jobs SET status = ?, started_at = NULL, processed = 0, message = NULL "
+            "WHERE status = ? AND heartbeat_at < ? RETURNING id",
+            (QUEUED, RUNNING, stale)
+        )
+        return len(rows)
+
+    def claim(self) -> Optional[Dict]:
+        """
+        Take the oldest queued job and mark it running
+
+        Returns:
+            The claimed job, or None if none is queued
+        """
+        self.requeue_stale()
+        now = time.time()
+        rows = self._execute(
+            "UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ?, cancel_requested = 0 "
+            "WHERE id = (SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1) AND status = ? "
+            "RETURNING id",
+            (RUNNING, now, now, QUEUED, QUEUED)
+        )
+        return self.get(rows[0]["id"]) if rows else None
+
+    def _heartbeat(self, job_id: str) -> bool:
+        """Record that a job is still running and return whether it should be cancelled"""
+        rows = self._execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? RETURNING cancel_requested",
+            (time.time(), job_id)
+        )
+        return bool(rows and rows[0]["cancel_requested"])
+
+    def start(self):
+        """Start the runner threads"""
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run_jobs, name=f"job-runner-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop the runner threads, putting the jobs they were running back in the queue"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run_jobs(self):
+        """Claim and run jobs until stopped (runner thread)"""
+        process = None
+        try:
+            while not self._stopping.is_set():
+                try:
+                    job = self.claim()
+                except sqlite3.Error as e:
+                    print(f"Could not claim a job: {e}")
+                    job = None
+
+                if job is None:
+                    self._wakeup.wait(config.JOB_HEARTBEAT_SECONDS)
+                    self._wakeup.clear()
+                    continue
+
+                if process is None:
+                    process = JobProcess(self.context)
+                    self.processes_started += 1
+                if not self._run(job, process):
+                    process = None
+        finally:
+            if process is not None:
+                process.close()
+
+    def _run(self, job: Dict, process: "JobProcess") -> bool:
+        """
+        Run a job in a job process, keeping its heartbeat until it ends
+
+        Returns:
+            Whether the process can run the next job (it is stopped when the job has to be)
+        """
+        process.submit(self.db_path, self.jobs_dir, job["id"], job["model_type"])
+        started = time.monotonic()
+
+        while True:
+            finished = process.wait(config.JOB_HEARTBEAT_SECONDS)
+            if finished:
+                return True
+            if finished is not None:
+                break
+
+            if self._stopping.is_set():
+                # Shutting down: another runner picks the job up again
+                process.terminate()
+                self._execute(
+                    "UPDATE jobs SET status = ?, started_at = NULL, processed = 0, message = NULL "
+                    "WHERE id = ? AND status = ?",
+                    (QUEUED, job["id"], RUNNING)
+                )
+                return False
+
+            if self._heartbeat(job["id"]):
+                process.terminate()
+                self.finish(job["id"], CANCELLED)
+                return False
+
+            if config.JOB_TIMEOUT_SECONDS and time.monotonic() - started > config.JOB_TIMEOUT_SECONDS:
+                process.terminate()
+                self.finish(job["id"], FAILED, f"Job did not finish within {config.JOB_TIMEOUT_SECONDS:g}s")
+                return False
+
+        # A job process that crashed left its job running
+        process.terminate()
+        self.finish(job["id"], FAILED, f"Job process exited with code {process.exitcode}")
+        return False
+
+
+class JobProcess:
+    """
+    Child process running jobs one at a time
+
+    The process prepares itself like the API's batch processes, loading and warming
+    up the default model (unless WARMUP_ON_STARTUP is off), and then runs the jobs
+    sent to it, so the models are loaded once rather than for every job.
+    """
+
+    def __init__(self, context):
+        """
+        Start process
+
+        Args:
+            context: multiprocessing context to start it with
+        """
+        self.conn, child_conn = context.Pipe()
+        model_type = config.DEFAULT_MODEL if config.WARMUP_ON_STARTUP else None
+        self.process = context.Process(target=run_job_process, args=(child_conn, model_type), name="job-process")
+        self.process.start()
+        child_conn.close()
+
+    @property
+    def exitcode(self) -> Optional[int]:
+        return self.process.exitcode
+
+    def submit(self, *args):
+        """Send the arguments of execute_job for a job"""
+        try:
+            self.conn.send(args)
+        except OSError:
+            # The process died (e.g. loading the models failed), wait() reports it
+            pass
+
+    def wait(self, timeout: float) -> Optional[bool]:
+        """
+        Wait for the job to finish
+
+        Returns:
+            True once it finished, False if the process died, None if it is still running
+        """
+        if not self.conn.poll(timeout):
+            return None
+        try:
+            self.conn.recv()
+        except EOFError:
+            return False
+        return True
+
+    def terminate(self):
+        """Stop the process, whatever it is doing"""
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        """Let the process exit once it is done with its job"""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(config.JOB_HEARTBEAT_SECONDS)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+def run_job_process(conn, model_type: Optional[str]):
+    """
+    Run the jobs sent by a runner until told to stop (runs in a job process)
+
+    Args:
+        conn: Connection receiving the arguments of execute_job, or None to stop, and
+            sending back the id of every finished job
+        model_type: Optional model type to load and warm up before the first job
+    """
+    import executors
+
+    # Lets terminate() stop the job and runs it at batch priority
+    executors.init_batch_process(model_type)
+
+    while True:
+        args = conn.recv()
+        if args is None:
+            return
+        execute_job(*args)
+        conn.send(args[2])
+
+
+def execute_job(db_path: Path, jobs_dir: Path, job_id: str, model_type: str):
+    """
+    Analyze the CSV of a job and store its result (runs in a job process)
+
+    Args:
+        db_path: SQLite database file
+        jobs_dir: Directory of the uploaded CSVs and results
+        job_id: Job id
+        model_type: Model type to use
+    """
+    import utils
+    from analyzer import get_analyzer
+
+    queue = JobQueue(db_path, jobs_dir, workers=0)
+    try:
+        df = utils.read_reviews_csv(queue.input_path(job_id))
+        if df.empty:
+            raise ValueError("CSV file is empty")
+
+        results = get_analyzer(model_type).analyze_batch(
+            df, progress_callback=lambda processed, total, message: queue.update_progress(job_id, processed, total, message)
+        )
+        utils.export_to_json(results, str(queue.result_path(job_id)))
+    except Exception as e:
+        queue.finish(job_id, FAILED, str(e))
+        return
+
+    queue.finish(job_id, COMPLETED)
+
+
+queue = JobQueue()
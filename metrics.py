@@ -0,0 +1,428 @@
+"""
+Lightweight Prometheus-style metrics for the API and the analysis pipeline
+
+Metrics live in the memory of the process serving the API. Under the pre-fork
+server every worker also writes its values to a file of its own in a shared
+directory (see share()), and /metrics merges the files of all the workers, so
+any worker answering a scrape shows the server's totals.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry = {}
+_local = threading.local()
+# Functions run before the values are collected, to set gauges sampled from other state
+_collectors = []
+# Directory shared with the other pre-fork workers, None when metrics are not shared
+_directory = None
+
+
+class Metric:
+    """Base class of metrics with a fixed set of label names"""
+
+    kind = None
+    # How the values of the pre-fork workers are merged: "sum" or "max"
+    aggregate = "sum"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        """
+        Initialize and register metric
+
+        Args:
+            name: Metric name
+            help: Description shown in the exposition
+            labelnames: Names of the labels every sample has
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _record(self, method: str, labels: Dict, value: float):
+        """Keep the update for replay in another process while capture() is active"""
+        captured = getattr(_local, "captured", None)
+        if captured is not None:
+            captured.append((self.name, method, labels, value))
+
+    def _labels_text(self, key: Tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def snapshot(self) -> Dict[Tuple, object]:
+        """Copy of the values of every sample, by label values"""
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+
+    def combine(self, total, value):
+        """Merge the values of the same sample from two workers"""
+        return max(total, value) if self.aggregate == "max" else total + value
+
+    def samples(self, values: Optional[Dict[Tuple, object]] = None) -> List[str]:
+        """Exposition lines of every sample, of this process unless values are given"""
+        values = self.snapshot() if values is None else values
+        return [f"{self.name}{self._labels_text(key)} {_format(value)}" for key, value in values.items()]
+
+    def render(self, values: Optional[Dict[Tuple, object]] = None) -> str:
+        """Exposition text of the metric"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples(values))
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._record("inc", labels, amount)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), aggregate: str = "sum"):
+        """
+        Initialize and register gauge
+
+        Args:
+            name: Metric name
+            help: Description shown in the exposition
+            labelnames: Names of the labels every sample has
+            aggregate: "sum" to add up the values of the pre-fork workers, "max" to keep the largest
+        """
+        super().__init__(name, help, labelnames)
+        self.aggregate = aggregate
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+        self._record("set", labels, value)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._record("inc", labels, amount)
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, +Inf, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+        self._record("observe", labels, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return sum(counts[:-1]) if counts else 0
+
+    def combine(self, total, value):
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, values: Optional[Dict[Tuple, object]] = None) -> List[str]:
+        values = self.snapshot() if values is None else values
+        lines = []
+        for key, counts in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_format(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels_text(key)} {_format(counts[-1])}")
+            lines.append(f"{self.name}_count{self._labels_text(key)} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def add_collector(collector: Callable[[], None]):
+    """
+    Run a function before every collection, e.g. to set gauges sampled from other state
+
+    Args:
+        collector: Function taking no arguments
+    """
+    _collectors.append(collector)
+
+
+def share(directory, interval: float = 1.0):
+    """
+    Share this process's metrics with the other pre-fork workers
+
+    The process writes its values to <directory>/<pid>.json now, every interval
+    seconds and before each scrape it answers, and collect() merges the files of
+    every process in the directory.
+
+    Args:
+        directory: Directory shared by the workers
+        interval: Seconds between writes
+    """
+    global _directory
+    _directory = Path(directory)
+    _write_values(_local_values())
+    threading.Thread(target=_sync_values, args=(interval,), name="metrics-sync", daemon=True).start()
+
+
+def mark_process_dead(pid: int, directory):
+    """
+    Drop the gauges of a worker that exited, keeping its counters and histograms
+
+    The file is renamed so that a new worker reusing the pid starts a file of its own
+    and the server's totals never go down.
+
+    Args:
+        pid: Process id of the worker
+        directory: Directory shared by the workers
+    """
+    path = Path(directory) / f"{pid}.json"
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return
+    kept = {name: samples for name, samples in data.items() if not isinstance(_registry.get(name), Gauge)}
+    dead = path.with_name(f"dead-{pid}-{time.time_ns()}.json")
+    dead.write_text(json.dumps(kept))
+    path.unlink()
+
+
+def _local_values() -> Dict[str, Dict[Tuple, object]]:
+    for collector in _collectors:
+        collector()
+    return {name: metric.snapshot() for name, metric in _registry.items()}
+
+
+def _write_values(values: Dict[str, Dict[Tuple, object]]):
+    path = _directory / f"{os.getpid()}.json"
+    data = {name: [[list(key), value] for key, value in samples.items()] for name, samples in values.items()}
+    # Write then rename, so readers never see a half-written file
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def _sync_values(interval: float):
+    time.sleep(interval)
+    while _directory is not None:
+        try:
+            _write_values(_local_values())
+        except OSError:
+            pass
+        time.sleep(interval)
+
+
+def _merged_values() -> Dict[str, Dict[Tuple, object]]:
+    merged = {name: {} for name in _registry}
+    for path in _directory.glob("*.json"):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            # Removed or replaced while listing the directory
+            continue
+        for name, samples in data.items():
+            metric = _registry.get(name)
+            if metric is None:
+                continue
+            values = merged[name]
+            for key, value in samples:
+                key = tuple(key)
+                values[key] = metric.combine(values[key], value) if key in values else value
+    return merged
+
+
+def collect() -> Dict[str, Dict[Tuple, object]]:
+    """
+    Get the values of every metric, merged over the pre-fork workers when shared
+
+    Returns:
+        Values of every sample by metric name and label values
+    """
+    values = _local_values()
+    if _directory is not None:
+        _write_values(values)
+        values = _merged_values()
+    update_derived(values)
+    return values
+
+
+def render() -> str:
+    """
+    Get every registered metric in the Prometheus text exposition format
+
+    Returns:
+        Exposition text
+    """
+    values = collect()
+    return "\n".join(metric.render(values[name]) for name, metric in _registry.items()) + "\n"
+
+
+@contextmanager
+def capture():
+    """
+    Collect the metric updates made by this thread in a with block
+
+    Used in process pool workers, whose metrics would otherwise never reach the
+    API process. The collected updates are returned to the API and applied there
+    with replay().
+
+    Yields:
+        List that receives the updates
+    """
+    previous = getattr(_local, "captured", None)
+    _local.captured = []
+    try:
+        yield _local.captured
+    finally:
+        _local.captured = previous
+
+
+def replay(updates: List):
+    """
+    Apply metric updates collected with capture() in another process
+
+    Args:
+        updates: Updates as (metric name, method, labels, value)
+    """
+    for name, method, labels, value in updates:
+        metric = _registry.get(name)
+        if metric is not None:
+            getattr(metric, method)(value, **labels)
+
+
+# API
+REQUESTS = Counter("sentiment_requests_total", "HTTP requests handled", ("method", "path", "status"))
+REQUESTS_IN_FLIGHT = Gauge("sentiment_requests_in_flight", "HTTP requests being handled")
+REQUEST_SECONDS = Histogram("sentiment_request_seconds", "HTTP request latency in seconds", ("method", "path"))
+
+# Analysis pipeline
+STAGE_SECONDS = Histogram(
+    "sentiment_stage_seconds",
+    "Latency of each analysis stage in seconds "
+    "(preprocess, parse, preprocess_parse, feature_extraction, classify, transformers, lime)",
+    ("stage",)
+)
+PREDICTION_CACHE_LOOKUPS = Counter(
+    "sentiment_prediction_cache_lookups_total", "Sentence prediction cache lookups", ("result",)
+)
+PREDICTION_CACHE_HIT_RATIO = Gauge(
+    "sentiment_prediction_cache_hit_ratio", "Share of sentence prediction cache lookups that were hits"
+)
+EXECUTOR_IN_FLIGHT = Gauge("sentiment_executor_in_flight", "Analyses running per endpoint group", ("group",))
+EXECUTOR_WAITING = Gauge("sentiment_executor_waiting", "Analyses waiting for a slot per endpoint group", ("group",))
+SCHEDULER_QUEUED = Gauge("sentiment_scheduler_queued", "Analyses queued in the scheduler per class", ("workload",))
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "sentiment_scheduler_wait_seconds", "Time analyses waited for a scheduler thread in seconds", ("workload",)
+)
+SINGLEFLIGHT_REQUESTS = Counter(
+    "sentiment_singleflight_requests_total",
+    "Requests that started an analysis (leader) or shared a running identical one (follower)", ("group", "role")
+)
+ADMISSION_REJECTED = Counter(
+    "sentiment_admission_rejected_total", "Requests rejected by admission control", ("group", "reason")
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "sentiment_model_load_seconds", "Time taken to load each model in seconds", ("model",), aggregate="max"
+)
+
+
+def stage_timer(stage: str):
+    """
+    Time an analysis stage
+
+    Args:
+        stage: Stage name
+
+    Returns:
+        Context manager observing the duration of its with block
+    """
+    return STAGE_SECONDS.time(stage=stage)
+
+
+@contextmanager
+def model_load_timer(model: str):
+    """
+    Record how long loading a model takes
+
+    Args:
+        model: Model name
+    """
+    start = time.perf_counter()
+    yield
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model=model)
+
+
+def update_derived(values: Dict[str, Dict[Tuple, object]]):
+    """
+    Compute the gauges that are derived from other metrics in collected values
+
+    Args:
+        values: Values from collect(), updated in place
+    """
+    lookups = values[PREDICTION_CACHE_LOOKUPS.name]
+    hits = lookups.get(("hit",), 0)
+    total = hits + lookups.get(("miss",), 0)
+    values[PREDICTION_CACHE_HIT_RATIO.name] = {(): round(hits / total, 4) if total else 0.0}
@@ -0,0 +1,125 @@
+"""
+Coalescing of concurrent API requests into batched analyses
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List
+
+import config
+import executors
+
+
+class MicroBatcher:
+    """
+    Gathers items submitted within a short window and processes them as one batch
+
+    Each caller awaits its own result. A batch is run once max_batch_size items
+    are waiting or max_wait_ms after its first item arrived. The wait adapts to
+    traffic: when requests arrive further apart than the window on average,
+    waiting would not gather anything, so items are processed right away.
+    """
+
+    def __init__(self, process_batch: Callable[[List], List], max_batch_size: int = config.MICROBATCH_MAX_SIZE,
+                 max_wait_ms: float = config.MICROBATCH_WINDOW_MS):
+        """
+        Initialize batcher
+
+        Args:
+            process_batch: Function taking a list of items and returning their results in the same order,
+                run in the scheduler's single class
+            max_batch_size: Maximum items per batch
+            max_wait_ms: Longest time the first item of a batch waits for others
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._last_arrival = None
+        self._mean_interval = None
+
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        """
+        Add an item to the next batch and wait for its result
+
+        Args:
+            item: Item to process
+
+        Returns:
+            Result of the item
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        self._track_arrival()
+
+        if len(self._pending) >= self.max_batch_size or self._sparse_traffic():
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _track_arrival(self):
+        """Update the moving average of the time between submitted items"""
+        now = time.monotonic()
+        if self._last_arrival is not None:
+            interval = now - self._last_arrival
+            if self._mean_interval is None:
+                self._mean_interval = interval
+            else:
+                self._mean_interval = 0.8 * self._mean_interval + 0.2 * interval
+        self._last_arrival = now
+
+    def _sparse_traffic(self) -> bool:
+        """Whether items arrive too far apart for waiting to gather a batch"""
+        return len(self._pending) == 1 and (self._mean_interval is None or self._mean_interval > self.max_wait)
+
+    def _flush(self):
+        """Start processing every pending item as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        """Process a batch on the scheduler and resolve the future of each item"""
+        items = [item for item, _ in batch]
+        self.batches += 1
+        self.items += len(items)
+
+        try:
+            async with executors.limiters["single"]:
+                results = await executors.run_scheduled("single", self.process_batch, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict:
+        """
+        Get batcher statistics
+
+        Returns:
+            Dictionary with the number of batches, items and mean batch size
+        """
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0
+        }
@@ -0,0 +1,131 @@
+"""
+ASGI middleware for the API
+"""
+import json
+import time
+
+import metrics
+
+
+class BodySizeLimitMiddleware:
+    """
+    Rejects requests whose body is larger than max_bytes with 413
+
+    Requests that declare a larger Content-Length are rejected before any of the
+    body is read. For the others the body is counted as it arrives and the request
+    is cut off as soon as it goes over the limit, so an oversized upload is never
+    read (or spooled to disk) in full.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        """
+        Initialize middleware
+
+        Args:
+            app: ASGI application
+            max_bytes: Largest accepted request body in bytes
+        """
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            if too_large:
+                return {"type": "http.disconnect"}
+
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Look like a disconnected client so the app stops reading the body
+                    too_large = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if too_large:
+                # Whatever the app answers to the cut off body is replaced by the 413 below
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not too_large:
+                raise
+
+        if too_large and not response_started:
+            await self._reject(send)
+
+    async def _reject(self, send):
+        """Send a 413 response"""
+        body = json.dumps({"detail": f"Request body is larger than {self.max_bytes} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close")
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and records their latency and the number in flight
+
+    Requests are labelled with their route's path template (e.g. /jobs/{job_id})
+    rather than the raw path, so the number of series stays fixed.
+    """
+
+    def __init__(self, app):
+        """
+        Initialize middleware
+
+        Args:
+            app: ASGI application
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def recording_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, recording_send)
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            metrics.REQUESTS.inc(method=scope["method"], path=path, status=status)
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"], path=path)
@@ -0,0 +1,132 @@
+"""
+Sentence-level prediction cache for the sentiment classifier
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable
+
+import config
+import metrics
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of the predictions of one model, keyed by sentence text
+
+    Entries expire after `ttl` seconds and the whole cache is dropped as soon as
+    another model object is used with it, e.g. after the analyzer
+    reloaded a retrained model. The model's file on disk isn't watched: a model
+    that was retrained but not reloaded still makes the same predictions. Safe to
+    share between threads.
+    """
+
+    def __init__(self, max_size: int = config.PREDICTION_CACHE_SIZE, ttl: float = config.CACHE_TTL):
+        """
+        Initialize cache
+
+        Args:
+            max_size: Maximum number of cached sentences
+            ttl: Seconds an entry stays valid (0 disables expiry)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Held rather than its id(), which a new model could reuse once the old one is freed
+        self._model = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _use_model(self, model: Any):
+        """Drop every entry if they were predicted by another model"""
+        if model is not self._model:
+            self._entries.clear()
+            self._model = model
+
+    def get_many(self, sentences: Iterable[str], model: Any) -> Dict[str, str]:
+        """
+        Look up cached predictions
+
+        Args:
+            sentences: Sentence texts
+            model: Model the predictions are for
+
+        Returns:
+            Dictionary with the predictions of the sentences that were cached
+        """
+        found = {}
+        hits = 0
+        misses = 0
+        now = time.monotonic()
+
+        with self._lock:
+            self._use_model(model)
+
+            for sentence in sentences:
+                entry = self._entries.get(sentence)
+
+                if entry is not None and (not self.ttl or entry[1] > now):
+                    self._entries.move_to_end(sentence)
+                    found[sentence] = entry[0]
+                    self.hits += 1
+                    hits += 1
+                else:
+                    if entry is not None:
+                        del self._entries[sentence]
+                    self.misses += 1
+                    misses += 1
+
+        metrics.PREDICTION_CACHE_LOOKUPS.inc(hits, result="hit")
+        metrics.PREDICTION_CACHE_LOOKUPS.inc(misses, result="miss")
+        return found
+
+    def put_many(self, predictions: Dict[str, str], model: Any):
+        """
+        Store predictions, evicting the least recently used entries when full
+
+        Args:
+            predictions: Dictionary of sentence text to prediction
+            model: Model that made the predictions
+        """
+        expires_at = time.monotonic() + self.ttl
+
+        with self._lock:
+            self._use_model(model)
+
+            for sentence, prediction in predictions.items():
+                self._entries[sentence] = (prediction, expires_at)
+                self._entries.move_to_end(sentence)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict:
+        """
+        Get cache statistics
+
+        Returns:
+            Dictionary with size, hit/miss counters and hit ratio
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
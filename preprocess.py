@@ -1,16 +1,38 @@
+import os
 import re
 import pandas as pd
 import numpy as np
+from spacy.tokens import Doc
 
 import constants
+import config
 
 appos = constants.appos
 
-def construct_spacy_obj(df, nlp):
-	# constructing spacy object for each review
-	with nlp.disable_pipes(['parser', 'ner']):
-		docs = list(nlp.pipe(df['reviewText']))
-		df['spacyObj'] = pd.Series(docs, index=df['reviewText'].index)
+def pipe_settings(texts, n_process=None, batch_size=None, max_process=None):
+	# Choosing n_process and batch_size for nlp.pipe. Long reviews get smaller batches and
+	# extra processes are only used when there are enough reviews to keep each one busy.
+	# max_process defaults to config.SPACY_N_PROCESS, which keeps the API workers single-process.
+	if n_process is None:
+		if max_process is None:
+			max_process = config.SPACY_N_PROCESS
+		n_process = max_process or os.cpu_count() or 1
+		n_process = max(1, min(n_process, len(texts) // config.SPACY_MIN_REVIEWS_PER_PROCESS))
+
+	if batch_size is None:
+		avg_length = sum(len(txt) for txt in texts) / max(len(texts), 1)
+		batch_size = int(min(1000, max(16, config.SPACY_BATCH_CHARS // max(avg_length, 1))))
+
+	return n_process, batch_size
+
+def construct_spacy_obj(df, nlp, n_process=None, batch_size=None):
+	n_process, batch_size = pipe_settings(df['reviewText'], n_process, batch_size)
+
+	# constructing spacy object for each review, nlp.pipe yields docs in input order.
+	# Pipes are disabled per call rather than with select_pipes, which changes the shared
+	# pipeline and breaks other threads using it at the same time.
+	docs = list(nlp.pipe(df['reviewText'], disable=['parser', 'ner'], n_process=n_process, batch_size=batch_size))
+	df['spacyObj'] = pd.Series(docs, index=df['reviewText'].index)
 	
 	return df
 
@@ -18,15 +40,9 @@ def reduce_lengthening(text):
 	pattern = re.compile(r"([a-zA-Z])\1{2,}")
 	return pattern.sub(r"\1\1", text)
 
-def preprocess_text(txt, nlp):
-	txt = txt.lower()
-	txt = reduce_lengthening(txt)
-	with nlp.disable_pipes('tagger', 'parser', 'ner', 'sentencizer'):
-		doc = nlp(txt)
-	tokens = [token.text for token in doc]
-	
+def normalize_tokens(tokens):
 	if len(tokens) <3:
-		return np.NaN
+		return np.nan
 	
 	for i, token in enumerate(tokens):
 		if token in appos:
@@ -40,9 +56,125 @@ def preprocess_text(txt, nlp):
 	
 	return txt
 
+def preprocess_text(txt, nlp):
+	txt = txt.lower()
+	txt = reduce_lengthening(txt)
+	doc = nlp(txt, disable=['tagger', 'parser', 'ner', 'sentencizer'])
+	
+	return normalize_tokens([token.text for token in doc])
+
+def preprocess_texts(texts, nlp, batch_size=1000):
+	# Same as preprocess_text but for many reviews at once. Only the tokens are needed here,
+	# so the reviews are streamed through the tokenizer alone instead of one nlp() call each.
+	texts = (reduce_lengthening(txt.lower()) for txt in texts)
+	
+	return [normalize_tokens([token.text for token in doc]) for doc in nlp.tokenizer.pipe(texts, batch_size=batch_size)]
+
+expansions_split = {}
+disallowed_chars = re.compile(r"[^a-zA-Z0-9.,:;\-'?!/\n]")
+space_runs = re.compile(r"( +)")
+
+def split_expansion(expansion, nlp):
+	# the apostrophe expansions are split the way the tokenizer would split them, ex. "cannot" => "can not"
+	if expansion not in expansions_split:
+		expansions_split[expansion] = [(token.text, len(token.whitespace_)) for token in nlp.tokenizer(expansion)]
+	
+	return expansions_split[expansion]
+
+def normalize_doc(doc, nlp):
+	# Token level version of normalize_tokens. Instead of joining the tokens into a string that has
+	# to be tokenized again, it returns a new Doc built from the normalized words and their spacing.
+	tokens = [token.text for token in doc]
+	
+	if len(tokens) <3:
+		return None
+	
+	# pieces of the joined text along with the number of spaces before each of them
+	pieces = []
+	pending_spaces = -1
+	for token in tokens:
+		pending_spaces += 1
+		
+		if token in appos:
+			for piece, spaces_after in split_expansion(appos[token], nlp):
+				pieces.append((piece, pending_spaces))
+				pending_spaces = spaces_after
+		elif token.isascii() and token.isalnum():
+			pieces.append((token, pending_spaces))
+			pending_spaces = 0
+		else:
+			token = disallowed_chars.sub(" ", token).replace("\n", ".")
+			for run in space_runs.split(token):
+				if run.startswith(" "):
+					pending_spaces += len(run)
+				elif run:
+					pieces.append((run, pending_spaces))
+					pending_spaces = 0
+	
+	words = []
+	spaces = []
+	for piece, spaces_before in pieces:
+		if ".." in piece:
+			piece = re.sub(r"\.{2,}", ".", piece)
+		
+		# the space right before punctuation is removed
+		if spaces_before == 1 and piece[0] in ".,:?;":
+			spaces_before = 0
+		
+		if not words:
+			if spaces_before:
+				words.append(" ")
+				spaces.append(False)
+		else:
+			# repeated dots are collapsed into one
+			if spaces_before == 0 and piece[0] == "." and words[-1].endswith("."):
+				piece = piece[1:]
+				if not piece:
+					continue
+			spaces[-1] = spaces_before > 0
+		
+		words.append(piece)
+		spaces.append(False)
+	
+	if spaces:
+		spaces[-1] = pending_spaces > 0
+	
+	return Doc(nlp.vocab, words=words, spaces=spaces)
+
+def deduplicate_reviews(df):
+	# Keeping one copy of every review. Reviews are compared after lower casing and reducing
+	# lengthening, which is where preprocess_text starts, so every copy would be processed the same.
+	# Returns the unique reviews and, for every review, the index of the copy that was kept.
+	df = df.dropna()
+	keys = df['reviewText'].map(lambda txt: reduce_lengthening(txt.lower()))
+	unique_df = df[~keys.duplicated()]
+
+	first_index = pd.Series(unique_df.index, index=keys[unique_df.index])
+	representatives = pd.Series(first_index[keys].values, index=df.index)
+
+	return unique_df.copy(), representatives
+
 def preprocess(df, nlp):
 	df.dropna(inplace=True)
-	df['reviewText'] = df['reviewText'].apply(lambda x: preprocess_text(x, nlp))
+	df['reviewText'] = pd.Series(preprocess_texts(df['reviewText'], nlp), index=df.index, dtype=object)
+	df.dropna(inplace=True)
+
+	return df
+
+def preprocess_and_parse(df, nlp, n_process=None, batch_size=None):
+	# Fused version of preprocess followed by construct_spacy_obj. Every review goes through the
+	# tokenizer once, gets normalized on its tokens and is then tagged and sentencized in one nlp.pipe pass.
 	df.dropna(inplace=True)
+	n_process, batch_size = pipe_settings(df['reviewText'], n_process, batch_size)
 
-	return df
\ No newline at end of file
+	texts = (reduce_lengthening(txt.lower()) for txt in df['reviewText'])
+	docs = [normalize_doc(doc, nlp) for doc in nlp.tokenizer.pipe(texts, batch_size=batch_size)]
+
+	df.drop(index=[i for i, doc in zip(df.index, docs) if doc is None], inplace=True)
+	docs = [doc for doc in docs if doc is not None]
+	df['reviewText'] = pd.Series([doc.text for doc in docs], index=df.index, dtype=object)
+
+	docs = list(nlp.pipe(docs, disable=['parser', 'ner'], n_process=n_process, batch_size=batch_size))
+	df['spacyObj'] = pd.Series(docs, index=df.index)
+
+	return df
@@ -0,0 +1,154 @@
+"""
+JSON encoding and field projection of API responses
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    print("orjson not available, responses are encoded with json. Install with: pip install orjson")
+
+
+def _default(value: Any) -> Any:
+    """Encode the numpy values analysis results may hold"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _plain_keys(value: Any) -> Any:
+    """Copy of a value with the numpy dict keys (e.g. from value_counts) made plain Python values"""
+    if isinstance(value, dict):
+        return {
+            (key.item() if isinstance(key, np.generic) else key): _plain_keys(item) for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_plain_keys(item) for item in value]
+    return value
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode a value as JSON
+
+    Dict keys that aren't strings (ints, floats, bools, None and their numpy
+    types) are turned into strings, as json.dumps does.
+
+    Args:
+        content: Value made of dicts, lists, strings, numbers and numpy values
+
+    Returns:
+        UTF-8 JSON
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        try:
+            return orjson.dumps(content, default=_default, option=option)
+        except orjson.JSONEncodeError:
+            # orjson doesn't take numpy keys, copying the content is only needed when it has some
+            return orjson.dumps(_plain_keys(content), default=_default, option=option)
+    return json.dumps(_plain_keys(content), default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded with orjson when it is installed
+
+    Returning one from an endpoint also skips FastAPI's validation and encoding of
+    the content against the endpoint's response_model, which only stays in the
+    OpenAPI schema. Use it for results built by the analyzer, whose shape is known.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """
+    Parse a fields query parameter
+
+    Fields are comma separated paths into the response. A path goes into nested
+    objects (and into every item of a list) with dots, and * matches every key of
+    an object, e.g. "summary,features.*.total" or "classification.sentiment".
+    Paths add up: "features.*.total,features.battery" keeps the total of every
+    feature and all of battery.
+
+    Args:
+        fields: Value of the parameter, or None for every field
+        allowed: Top-level fields of the response
+
+    Returns:
+        Paths, or None for every field
+
+    Raises:
+        ValueError: If a path starts with a field the response doesn't have
+    """
+    if fields is None:
+        return None
+
+    paths = [path.strip() for path in fields.split(",") if path.strip()]
+    allowed = set(allowed)
+    unknown = sorted({path.split(".")[0] for path in paths} - allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(sorted(allowed))})")
+    return paths
+
+
+def project(content: Dict, paths: Optional[List[str]]) -> Dict:
+    """
+    Keep only some fields of a response
+
+    The content isn't modified, as it may be shared with other requests.
+
+    Args:
+        content: Response content
+        paths: Paths from parse_fields, or None for every field
+
+    Returns:
+        Content with only the fields on the paths
+    """
+    if paths is None:
+        return content
+
+    tree = {}
+    for path in paths:
+        node = tree
+        for key in path.split("."):
+            node = node.setdefault(key, {})
+    return _select(content, tree)
+
+
+def _select(value: Any, tree: Dict) -> Any:
+    """Keep the parts of a value in a tree of requested keys (an empty tree keeps all of it)"""
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_select(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    if "*" in tree:
+        return {key: _select(item, _merge(tree["*"], tree.get(key))) for key, item in value.items()}
+    return {key: _select(value[key], subtree) for key, subtree in tree.items() if key in value}
+
+
+def _merge(wildcard: Dict, subtree: Optional[Dict]) -> Dict:
+    """Tree of the keys requested for a key matched by * and maybe named too"""
+    if subtree is None:
+        return wildcard
+    if not wildcard or not subtree:
+        # One of the paths asks for the whole value
+        return {}
+    merged = dict(wildcard)
+    for key, child in subtree.items():
+        merged[key] = _merge(merged[key], child) if key in merged else child
+    return merged
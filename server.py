@@ -0,0 +1,254 @@
+"""
+Pre-fork production server for the API
+
+The parent process loads the analyzer once, freezes the garbage collector and
+forks uvicorn workers that accept connections on a shared socket. The workers
+share the parent's model pages copy-on-write instead of each loading en_core_web_sm,
+the fastText model and model.joblib again.
+
+The workers write their metrics to files in a shared directory (METRICS_DIR)
+that /metrics merges, so every scrape shows the server's totals whichever worker
+answers it. Everything else is per worker: the admission budgets (ADMISSION_*)
+and the executors, so the server's limits are these times the workers. Batch
+jobs are the exception: the workers only queue them and a single job runner
+process, also forked by the parent, runs JOB_WORKERS of them at a time for the
+whole server.
+
+Usage:
+    python server.py [--workers N] [--host HOST] [--port PORT]
+"""
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import uvicorn
+
+import config
+import metrics
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """
+    Create the listening socket shared by all workers
+
+    Args:
+        host: Interface to bind
+        port: Port to bind
+
+    Returns:
+        Bound, listening socket
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_models(model_type: str):
+    """
+    Load and warm up the analyzer in the get_analyzer singleton before forking
+
+    Workers inherit the warm analyzer, so their own startup warmup has nothing
+    left to do.
+
+    Args:
+        model_type: Model type to load
+    """
+    from analyzer import get_analyzer
+
+    start = time.perf_counter()
+    analyzer = get_analyzer(model_type)
+    print(f"Loaded {model_type} analyzer in {time.perf_counter() - start:.1f}s")
+    print(f"Warmed up {model_type} analyzer in {analyzer.warmup():.1f}s")
+
+
+def metrics_directory() -> Path:
+    """
+    Get an empty directory for the workers to share their metrics in
+
+    Returns:
+        METRICS_DIR with the files of a previous run removed, or a new temporary directory
+    """
+    if not config.METRICS_DIR:
+        return Path(tempfile.mkdtemp(prefix="sentiment-metrics-"))
+
+    directory = Path(config.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    for path in directory.glob("*.json"):
+        path.unlink()
+    return directory
+
+
+def run_worker(sock: socket.socket, app, metrics_dir: Path):
+    """Serve the app on the shared socket until told to stop (runs in a forked worker)"""
+    # Objects created from here on are collected as usual, the frozen ones stay shared
+    gc.enable()
+    metrics.share(metrics_dir, config.METRICS_SYNC_SECONDS)
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level=config.LOG_LEVEL.lower()))
+    server.run(sockets=[sock])
+
+
+def fork_worker(sock: socket.socket, app, metrics_dir: Path) -> int:
+    """
+    Fork a worker process
+
+    Args:
+        sock: Listening socket shared by the workers
+        app: ASGI app to serve
+        metrics_dir: Directory the workers share their metrics in
+
+    Returns:
+        Process id of the worker
+    """
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            run_worker(sock, app, metrics_dir)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def run_job_runner(workers: int):
+    """Run the batch job queue's runners until told to stop (runs in a forked process)"""
+    import jobs
+
+    gc.enable()
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    jobs.queue.workers = workers
+    jobs.queue.start()
+    while not stopping.is_set():
+        stopping.wait(1)
+    jobs.queue.stop()
+
+
+def fork_job_runner(workers: int, sock: Optional[socket.socket] = None) -> int:
+    """
+    Fork the job runner process
+
+    Args:
+        workers: Jobs run at once
+        sock: Listening socket to close in the job runner, which serves no requests
+
+    Returns:
+        Process id of the job runner
+    """
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        if sock is not None:
+            sock.close()
+        try:
+            run_job_runner(workers)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def serve(workers: int, host: str, port: int, model_type: str = config.DEFAULT_MODEL):
+    """
+    Load the models, fork the workers and keep them running
+
+    Args:
+        workers: Number of worker processes
+        host: Interface to listen on
+        port: Port to listen on
+        model_type: Model type to load before forking
+    """
+    # Nothing allocated while loading is freed later, so collecting now would only
+    # touch (and un-share) pages the workers are about to inherit
+    gc.disable()
+
+    load_models(model_type)
+    import api
+    import jobs
+
+    # The workers only queue jobs, the job runner process runs them
+    job_workers = jobs.queue.workers
+    jobs.queue.workers = 0
+
+    # Move every object loaded so far to the permanent generation, so collections in
+    # the workers never write to their headers and the pages stay shared
+    gc.collect()
+    gc.freeze()
+
+    job_runner = fork_job_runner(job_workers) if job_workers > 0 else None
+
+    metrics_dir = metrics_directory()
+    sock = bind_socket(host, port)
+    print(f"Serving on {host}:{port} with {workers} workers (parent pid {os.getpid()})")
+
+    children = {fork_worker(sock, api.app, metrics_dir) for _ in range(workers)}
+    if job_runner is not None:
+        children.add(job_runner)
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Replace workers that die until asked to stop
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if pid != job_runner:
+            metrics.mark_process_dead(pid, metrics_dir)
+        if stopping:
+            continue
+        if pid == job_runner:
+            print(f"Job runner {pid} exited with status {status}, starting a new one")
+            time.sleep(1)
+            job_runner = fork_job_runner(job_workers, sock)
+            children.add(job_runner)
+        else:
+            print(f"Worker {pid} exited with status {status}, starting a new one")
+            time.sleep(1)
+            children.add(fork_worker(sock, api.app, metrics_dir))
+
+    sock.close()
+    if not config.METRICS_DIR:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork server for the sentiment analysis API")
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS or os.cpu_count() or 1)
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    args = parser.parse_args()
+
+    serve(args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
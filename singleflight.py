@@ -0,0 +1,106 @@
+"""
+Sharing of one analysis between concurrent identical API requests
+"""
+import asyncio
+import hashlib
+from typing import Awaitable, Callable
+
+import metrics
+
+
+def content_key(*parts) -> str:
+    """
+    Key identifying a request by its content
+
+    Args:
+        parts: Strings or bytes the result depends on (input digest, model type, ...)
+
+    Returns:
+        Hex digest of the parts
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def file_digest(file, block_size: int = 1 << 20) -> str:
+    """
+    Hash a file object without loading it into memory, leaving it at its start
+
+    Args:
+        file: Seekable binary file object
+        block_size: Bytes read at a time
+
+    Returns:
+        Hex SHA-256 digest of the file's contents
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(block_size), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and gives its result to every caller
+
+    A call made while another with the same key is running waits for that one
+    instead of starting its own, and gets the same result or exception. Results
+    are shared as they are, so callers must not modify them. The call keeps
+    running when the caller that started it is cancelled, as long as others
+    are waiting for it.
+    """
+
+    def __init__(self, group: str):
+        """
+        Initialize single-flight
+
+        Args:
+            group: Endpoint group, used as the metric label
+        """
+        self.group = group
+        self._calls = {}
+
+    async def run(self, key: str, call: Callable[[], Awaitable]):
+        """
+        Run a call, or wait for the running one with the same key
+
+        Args:
+            key: Key of the call's input (see content_key)
+            call: Coroutine function doing the work
+
+        Returns:
+            Result of the call
+        """
+        call_state = self._calls.get(key)
+        if call_state is None:
+            task = asyncio.ensure_future(call())
+            call_state = self._calls[key] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda _: self._forget(key, task))
+            metrics.SINGLEFLIGHT_REQUESTS.inc(group=self.group, role="leader")
+        else:
+            metrics.SINGLEFLIGHT_REQUESTS.inc(group=self.group, role="follower")
+
+        task = call_state["task"]
+        call_state["waiters"] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            call_state["waiters"] -= 1
+            if call_state["waiters"] == 0 and not task.done():
+                # Every caller was cancelled, nobody wants the result any more
+                self._forget(key, task)
+                task.cancel()
+
+    def _forget(self, key: str, task: asyncio.Future):
+        """Let later calls with the key start a new task"""
+        if key in self._calls and self._calls[key]["task"] is task:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        """Number of calls running"""
+        return len(self._calls)
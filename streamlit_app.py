@@ -524,12 +524,26 @@ def analyze_batch_reviews(df, model_type, show_wordcloud):
         progress_bar.progress(progress)
         status_text.text(f"{status} ({current}/{total})")
     
+    live_metrics = st.empty()
+    
     try:
-        # Analyze
-        results = analyzer.analyze_batch(df, progress_callback=progress_callback)
+        # Analyze chunk by chunk, showing running totals as they come in
+        results = {"features": {}, "classification": [], "summary": {}}
+        for partial in analyzer.analyze_batch_iter(df, progress_callback=progress_callback):
+            results["classification"].extend(partial["classification"])
+            results["features"] = partial["features"]
+            results["summary"] = partial["summary"]
+            
+            with live_metrics.container():
+                col1, col2, col3 = st.columns(3)
+                label = "Reviews Read for Features" if partial["stage"] == "features" else "Reviews Processed"
+                col1.metric(label, f"{partial['processed']}/{partial['total']}")
+                col2.metric("Positive Sentences", partial["summary"]["positive_count"])
+                col3.metric("Negative Sentences", partial["summary"]["negative_count"])
         
         progress_bar.empty()
         status_text.empty()
+        live_metrics.empty()
         
         # Store results in session state so they persist across reruns
         st.session_state.batch_analysis_results = results
@@ -543,6 +557,7 @@ def analyze_batch_reviews(df, model_type, show_wordcloud):
         st.code(traceback.format_exc())
         progress_bar.empty()
         status_text.empty()
+        live_metrics.empty()
 
 
 def display_batch_results(results, show_wordcloud):
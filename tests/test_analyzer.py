@@ -148,6 +148,1347 @@ class TestAnalyzer:
         assert "custom_lr" in comparison["models"]
 
 
+class TestSpacyPipeline:
+    """Test spaCy model loading"""
+
+    def test_load_only_configured_components(self, tmp_path):
+        """Test components outside the configured set are excluded"""
+        import spacy
+        from analyzer import load_spacy_pipeline
+
+        nlp = spacy.blank("en")
+        nlp.add_pipe("attribute_ruler")
+        nlp.add_pipe("entity_ruler")
+        nlp.to_disk(tmp_path / "model")
+
+        loaded = load_spacy_pipeline(str(tmp_path / "model"), components=["attribute_ruler"])
+
+        assert loaded.pipe_names == ["attribute_ruler"]
+        assert loaded.disabled == []
+
+    def test_construct_spacy_obj_leaves_pipeline_unchanged(self):
+        """Test parsing disables pipes per call, without touching the shared pipeline"""
+        import spacy
+        from preprocess import construct_spacy_obj
+
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        df = pd.DataFrame({'reviewText': ["battery is good. camera is poor"]})
+
+        df = construct_spacy_obj(df, nlp, n_process=1)
+
+        assert len(list(df['spacyObj'][0].sents)) == 2
+        assert nlp.pipe_names == ["sentencizer"]
+        assert nlp.disabled == []
+
+    def test_shared_pipeline_parsed_from_threads(self):
+        """Test threads parsing with one pipeline all get the disabled pipes skipped and none re-enabled"""
+        import spacy
+        from concurrent.futures import ThreadPoolExecutor
+        from preprocess import construct_spacy_obj
+
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        ruler = nlp.add_pipe("entity_ruler", name="ner")
+        ruler.add_patterns([{"label": "PART", "pattern": "battery"}])
+
+        def parse(_):
+            df = pd.DataFrame({'reviewText': ["battery is good. camera is poor"] * 20})
+            docs = construct_spacy_obj(df, nlp, n_process=1)['spacyObj']
+            return [(len(list(doc.sents)), len(doc.ents)) for doc in docs]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = [result for parsed in pool.map(parse, range(32)) for result in parsed]
+
+        assert set(results) == {(2, 0)}
+        assert nlp.disabled == []
+        assert len(nlp("battery").ents) == 1
+
+    def test_pipe_settings_fan_out(self, monkeypatch):
+        """Test workers parse in one process by default and training may use every core"""
+        from preprocess import pipe_settings
+        monkeypatch.setattr(config, "SPACY_MIN_REVIEWS_PER_PROCESS", 1)
+        monkeypatch.setattr("os.cpu_count", lambda: 4)
+        texts = ["good battery"] * 10
+
+        assert pipe_settings(texts)[0] == 1
+        assert pipe_settings(texts, max_process=0)[0] == 4
+        assert pipe_settings(texts[:2], max_process=0)[0] == 2
+
+
+class TestTaxonomy:
+    """Test the cached aspect taxonomy"""
+
+    def test_rebuilt_after_retraining(self, tmp_path, monkeypatch):
+        """Test a taxonomy older than the model file is rebuilt and a newer one is reused"""
+        import os
+        import joblib
+        import train
+        monkeypatch.setattr(config, "MODEL_PATH", tmp_path / "model.joblib")
+        monkeypatch.setattr(config, "TAXONOMY_PATH", tmp_path / "taxonomy.joblib")
+        monkeypatch.setattr(config, "TRAINING_DATA", tmp_path / "training.csv")
+        monkeypatch.setattr(train, "load_training_data", lambda nlp: None)
+        monkeypatch.setattr(train, "feature_extraction", lambda df, ft_model, nlp: {"battery": ["charge"]})
+        (tmp_path / "training.csv").write_text("good battery,5\n")
+
+        joblib.dump({"screen": []}, config.TAXONOMY_PATH)
+        joblib.dump("model", config.MODEL_PATH)
+        os.utime(config.TAXONOMY_PATH, (1, 1))
+
+        assert train.get_taxonomy(None, None) == {"battery": ["charge"]}
+        assert joblib.load(config.TAXONOMY_PATH) == {"battery": ["charge"]}
+
+        monkeypatch.setattr(train, "feature_extraction", lambda df, ft_model, nlp: pytest.fail("taxonomy rebuilt"))
+        assert train.get_taxonomy(None, None) == {"battery": ["charge"]}
+
+
+class TestPreprocess:
+    """Test review preprocessing"""
+
+    @pytest.fixture
+    def nlp(self):
+        """Blank English pipeline with the component names preprocess_text disables"""
+        import spacy
+        from spacy.language import Language
+
+        if "test_noop" not in Language.factories:
+            Language.component("test_noop", func=lambda doc: doc)
+
+        nlp = spacy.blank("en")
+        for name in ["tagger", "parser", "ner"]:
+            nlp.add_pipe("test_noop", name=name)
+        nlp.add_pipe("sentencizer")
+        return nlp
+
+    def test_batch_matches_per_review(self, nlp):
+        """Test the tokenizer-only batch path gives the same text as the per-review path"""
+        from preprocess import preprocess_text, preprocess_texts
+        reviews = [
+            "I can't believe the BATTERYYYY lasts 2 days!!\nCamera is gooood",
+            "ok",
+            "Display @ night is   too dim... it's a shame",
+        ]
+
+        expected = [preprocess_text(review, nlp) for review in reviews]
+        results = preprocess_texts(reviews, nlp)
+
+        assert results[0] == expected[0] == "i ca not believe the batteryy lasts 2 days ! !. camera is good"
+        assert pd.isna(results[1]) and pd.isna(expected[1])
+        assert results[2] == expected[2]
+
+    def test_preprocess_drops_short_reviews(self, nlp):
+        """Test preprocess keeps index alignment and drops invalid reviews"""
+        from preprocess import preprocess
+        df = pd.DataFrame({
+            'reviewText': ["Great phone with excellent camera!", "ok", None, "Battery life is terrible."],
+            'rating': [5, 3, 4, 2]
+        })
+
+        df = preprocess(df, nlp)
+
+        assert list(df.index) == [0, 3]
+        assert df.loc[3, 'reviewText'] == "battery life is terrible."
+
+    def test_deduplicate_reviews(self):
+        """Test identical reviews are collapsed onto their first copy"""
+        from preprocess import deduplicate_reviews
+        df = pd.DataFrame({
+            'reviewText': ["Good phoneee", "Nice camera", "GOOD PHONEEEEE", None, "good phone"],
+            'rating': [5, 4, 5, 3, 4]
+        })
+
+        unique_df, representatives = deduplicate_reviews(df)
+
+        assert list(unique_df.index) == [0, 1, 4]
+        assert representatives.to_dict() == {0: 0, 1: 1, 2: 0, 4: 4}
+
+    def test_fused_matches_two_pass(self, nlp):
+        """Test single pass normalize-and-parse gives the same reviews as preprocess + construct_spacy_obj"""
+        from preprocess import preprocess, construct_spacy_obj, preprocess_and_parse
+        reviews = [
+            "I can't believe the BATTERYYYY lasts 2 days!!\nCamera is gooood",
+            "ok",
+            "Display @ night is   too dim... it's a shame , sadly",
+            "Superb phone.\n\nDelivery was late . Packing good",
+        ]
+
+        expected = construct_spacy_obj(preprocess(pd.DataFrame({'reviewText': reviews}), nlp), nlp)
+        results = preprocess_and_parse(pd.DataFrame({'reviewText': reviews}), nlp)
+
+        assert list(results.index) == list(expected.index) == [0, 2, 3]
+        assert list(results['reviewText']) == list(expected['reviewText'])
+        for doc, expected_doc in zip(results['spacyObj'], expected['spacyObj']):
+            assert doc.text == expected_doc.text
+            assert [sent.text for sent in doc.sents] == [sent.text for sent in expected_doc.sents]
+
+
+@pytest.fixture
+def parsed_df():
+    """Reviews parsed with a blank English pipeline"""
+    import spacy
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+
+    df = pd.DataFrame({
+        'reviewText': [
+            "the battery is good. camera is poor!",
+            "nice phone",
+            "battery and camera are bad. the camera is great"
+        ] * 10
+    })
+    df['spacyObj'] = list(nlp.pipe(df['reviewText']))
+    return df
+
+
+@pytest.fixture
+def model():
+    """Tiny tfidf + logistic regression pipeline"""
+    from sklearn.pipeline import Pipeline
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    return Pipeline([
+        ('tfidf', TfidfVectorizer()),
+        ('lr', LogisticRegression())
+    ]).fit(
+        ["battery is good", "battery is bad", "camera is great", "camera is poor"],
+        ["Positive", "Negative", "Positive", "Negative"]
+    )
+
+
+class TestClassify:
+    """Test aspect classification"""
+
+    def test_batched_matches_per_sentence(self, parsed_df, model):
+        """Test chunked scoring gives the same results as one predict per sentence"""
+        from classifiation import classify
+        features = {"battery": ["charge"], "camera": []}
+
+        expected, _, _ = classify(parsed_df, features, model, batch_size=1)
+        results, _, _ = classify(parsed_df, features, model, batch_size=7)
+
+        assert len(results) == 30
+        assert results.equals(expected)
+
+    def test_expand_duplicates(self):
+        """Test results of a kept review are repeated for each of its duplicates"""
+        from classifiation import expand_duplicates
+        results_df = pd.DataFrame({
+            'category': ["battery", "camera", "camera"],
+            'sentence': ["battery is good.", "camera is poor!", "nice camera"],
+            'sentiment': ["Positive", "Negative", "Positive"]
+        }, index=[0, 0, 1])
+        representatives = pd.Series([0, 1, 0, 5], index=[0, 1, 2, 5])
+
+        expanded = expand_duplicates(results_df, representatives)
+
+        assert list(expanded.index) == [0, 0, 1, 2, 2]
+        assert list(expanded['sentence']) == [
+            "battery is good.", "camera is poor!", "nice camera", "battery is good.", "camera is poor!"
+        ]
+
+    def test_features_in_reviews(self, parsed_df):
+        """Test only taxonomy features mentioned in the reviews are kept"""
+        from classifiation import features_in_reviews
+        taxonomy = {"display": ["screen"], "battery": ["charge"], "camera": []}
+
+        features = features_in_reviews(parsed_df, taxonomy)
+
+        assert list(features.keys()) == ["battery", "camera"]
+        assert features["battery"] == ["charge"]
+
+
+class TestFeatureExtraction:
+    """Test feature extraction helpers"""
+
+    def test_similarity_matrix_matches_cosine_similarity(self):
+        """Test the pairwise matrix agrees with sklearn's cosine similarity"""
+        import numpy as np
+        from sklearn.metrics.pairwise import cosine_similarity
+        from feature_extraction import similarity_matrix
+
+        rng = np.random.default_rng(0)
+        vectors = {word: rng.normal(size=100).astype(np.float32) for word in ["battery", "camera", "screen"]}
+
+        class FakeFastText:
+            def get_word_vector(self, word):
+                return vectors[word]
+
+        words = list(vectors)
+        similarities = similarity_matrix(words, FakeFastText())
+
+        for i, word1 in enumerate(words):
+            for j, word2 in enumerate(words):
+                expected = cosine_similarity(vectors[word1].reshape(1, -1), vectors[word2].reshape(1, -1))
+                assert abs(similarities[i, j] - expected[0][0]) < 1e-6
+
+    def test_similarity_matrix_empty(self):
+        """Test no candidate features gives an empty matrix"""
+        from feature_extraction import similarity_matrix
+        assert similarity_matrix([], None).shape == (0, 0)
+
+    def test_count_nouns_in_parts(self):
+        """Test counting a corpus part by part gives the counts of counting it at once"""
+        import spacy
+        from spacy.tokens import Doc
+        from feature_extraction import count_nouns
+        nlp = spacy.blank("en")
+
+        def review(*tagged):
+            words = [word for word, _ in tagged]
+            tags = [tag for _, tag in tagged]
+            return Doc(nlp.vocab, words=words, tags=tags, pos=["NOUN" if tag == "NN" else "X" for tag in tags])
+
+        df = pd.DataFrame({'spacyObj': [
+            review(("battery", "NN"), ("life", "NN"), ("is", "VBZ"), ("good", "JJ")),
+            review(("camera", "NN"), ("is", "VBZ"), ("poor", "JJ")),
+            review(("battery", "NN"), ("life", "NN"), ("and", "CC"), ("camera", "NN"))
+        ]})
+        weights = pd.Series([2, 1, 3])
+
+        all_nouns, noun_phrases = count_nouns(df, nlp, weights)
+        part_nouns, part_phrases = count_nouns(df.iloc[:2], nlp, weights)
+        count_nouns(df.iloc[2:], nlp, weights, part_nouns, part_phrases)
+
+        assert all_nouns == {"battery": 5, "life": 5, "camera": 4}
+        assert noun_phrases == {"battery life": 5}
+        assert list(part_nouns.items()) == list(all_nouns.items())
+        assert list(part_phrases.items()) == list(noun_phrases.items())
+
+    def test_sorted_counts_matches_value_counts(self):
+        """Test weighted counts are ordered like value_counts of the repeated nouns"""
+        from collections import Counter
+        from feature_extraction import sorted_counts
+
+        nouns = ["screen", "battery", "camera", "battery", "price", "camera", "screen", "lens"]
+        weights = [1, 3, 2, 1, 4, 1, 2, 1]
+        counts = Counter()
+        for noun, weight in zip(nouns, weights):
+            counts[noun] += weight
+        repeated = pd.Series([noun for noun, weight in zip(nouns, weights) for _ in range(weight)])
+
+        expected = repeated.value_counts()
+        assert list(sorted_counts(counts).items()) == list(expected.items())
+        assert sorted_counts(Counter()).empty
+
+
+
+@pytest.fixture
+def blank_analyzer(model):
+    """Analyzer with a blank English pipeline and a fixed taxonomy"""
+    import spacy
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+
+    analyzer = SentimentAnalyzer.__new__(SentimentAnalyzer)
+    analyzer.model_type = "logistic_regression"
+    analyzer.nlp = nlp
+    analyzer.ft_model = None
+    analyzer.custom_model = model
+    analyzer.taxonomy = {"battery": ["charge"], "camera": []}
+    analyzer.prediction_cache = None
+    analyzer.transformers_pipeline = None
+    analyzer.warmed_up = False
+    return analyzer
+
+
+def stand_in_feature_extraction(monkeypatch):
+    """Replace the noun-based feature extraction, which the blank pipeline has no POS tags for"""
+    import analyzer as analyzer_module
+    from collections import Counter, OrderedDict
+
+    def count_nouns(df, nlp, weights=None, all_nouns=None, noun_phrases=None):
+        # Counts the reviews instead of their nouns
+        all_nouns = Counter() if all_nouns is None else all_nouns
+        all_nouns["reviews"] += len(df) if weights is None else int(weights.sum())
+        return all_nouns, noun_phrases
+
+    def features_from_counts(all_nouns, noun_phrases, ft_model):
+        assert all_nouns["reviews"] > config.SMALL_BATCH_MAX_REVIEWS
+        return OrderedDict([("camera", []), ("screen", [])])
+
+    monkeypatch.setattr(analyzer_module, "count_nouns", count_nouns)
+    monkeypatch.setattr(analyzer_module, "features_from_counts", features_from_counts)
+
+
+class TestBatchIter:
+    """Test chunked batch analysis"""
+
+    @pytest.fixture
+    def analyzer(self, blank_analyzer):
+        return blank_analyzer
+
+    @pytest.fixture
+    def reviews(self):
+        """Reviews with duplicates"""
+        return pd.DataFrame({
+            'reviewText': [
+                "the battery is good. camera is poor!",
+                "nice phone with a good camera",
+                "battery and camera are bad. the camera is great"
+            ] * 10,
+            'rating': [5, 3, 2] * 10
+        })
+
+    @pytest.fixture
+    def large_reviews(self, monkeypatch):
+        """More reviews than SMALL_BATCH_MAX_REVIEWS, whose features are extracted from the batch"""
+        stand_in_feature_extraction(monkeypatch)
+        return pd.DataFrame({
+            'reviewText': [
+                "the battery is good. camera is poor!",
+                "nice phone with a good camera",
+                "battery and camera are bad. the camera is great"
+            ] * 20,
+            'rating': [5, 3, 2] * 20
+        })
+
+    def test_chunks_match_batch(self, analyzer, reviews):
+        """Test the chunks add up to the results of analyze_batch"""
+        expected = analyzer.analyze_batch(reviews.copy())
+        partials = list(analyzer.analyze_batch_iter(reviews.copy(), chunk_size=7))
+
+        assert [partial["processed"] for partial in partials] == [7, 14, 21, 28, 30]
+        assert [partial["done"] for partial in partials] == [False] * 4 + [True]
+
+        rows = [row for partial in partials for row in partial["classification"]]
+        assert rows == expected["classification"]
+        assert partials[-1]["features"] == expected["features"]
+        for key in ["total_sentences", "positive_count", "negative_count", "features_found"]:
+            assert partials[-1]["summary"][key] == expected["summary"][key]
+
+    def test_large_batch_matches_batch(self, analyzer, large_reviews):
+        """Test a batch over SMALL_BATCH_MAX_REVIEWS uses the features extracted from it, like analyze_batch"""
+        expected = analyzer.analyze_batch(large_reviews.copy())
+        partials = list(analyzer.analyze_batch_iter(large_reviews.copy(), chunk_size=16))
+
+        assert [row for partial in partials for row in partial["classification"]] == expected["classification"]
+        assert partials[-1]["features"] == expected["features"]
+        assert list(expected["features"]) == ["camera", "screen"]
+
+    def test_large_batch_yields_incrementally(self, analyzer, large_reviews, monkeypatch):
+        """Test a batch over SMALL_BATCH_MAX_REVIEWS yields every chunk before parsing the next one"""
+        parsed = []
+        parse_reviews = analyzer._parse_reviews
+        monkeypatch.setattr(analyzer, "_parse_reviews", lambda df: parsed.append(df.index[0]) or parse_reviews(df))
+        partials = analyzer.analyze_batch_iter(large_reviews.copy(), chunk_size=16)
+
+        first = next(partials)
+        assert first["stage"] == "features"
+        assert first["processed"] == 16
+        assert parsed == [0]
+
+        stages = [first["stage"]]
+        for partial in partials:
+            stages.append(partial["stage"])
+            if partial["stage"] == "classify" and len(stages) == 5:
+                # The first classified chunk comes before the rest are parsed again
+                assert partial["classification"]
+                assert parsed == [0, 16, 32, 48, 0]
+
+        assert stages == ["features"] * 4 + ["classify"] * 4
+        assert parsed == [0, 16, 32, 48] * 2
+
+    def test_summary_matches_batch(self, analyzer, large_reviews):
+        """Test the last chunk's summary has the review counts of analyze_batch's"""
+        expected = analyzer.analyze_batch(large_reviews.copy())
+        partials = list(analyzer.analyze_batch_iter(large_reviews.copy(), chunk_size=16))
+
+        assert partials[-1]["summary"] == expected["summary"]
+        assert expected["summary"]["unique_reviews"] == 3
+
+    def test_deadline_path_matches_batch(self, analyzer, large_reviews):
+        """Test a deadline that isn't reached changes nothing about the results"""
+        import time
+        expected = analyzer.analyze_batch(large_reviews.copy())
+        results = analyzer.analyze_batch_within(large_reviews.copy(), deadline=time.time() + 60, chunk_size=16)
+
+        assert not results["partial"]
+        for key in ["features", "classification", "summary"]:
+            assert results[key] == expected[key]
+
+    def test_progress_is_row_based(self, analyzer, reviews):
+        """Test progress is reported once per chunk with the reviews processed so far"""
+        progress = []
+        for _ in analyzer.analyze_batch_iter(reviews, chunk_size=12,
+                                             progress_callback=lambda current, total, status: progress.append((current, total))):
+            pass
+
+        assert progress == [(12, 30), (24, 30), (30, 30)]
+
+    def test_empty(self, analyzer):
+        """Test an empty batch yields a single finished chunk"""
+        partials = list(analyzer.analyze_batch_iter(pd.DataFrame({'reviewText': [], 'rating': []})))
+
+        assert len(partials) == 1
+        assert partials[0]["done"]
+        assert partials[0]["classification"] == []
+
+    def test_deadline_returns_partial_results(self, analyzer, reviews, monkeypatch):
+        """Test the analysis stops at the first chunk boundary after the deadline"""
+        import analyzer as analyzer_module
+
+        classified = []
+        monkeypatch.setattr(analyzer_module, "deadline_passed", lambda deadline: len(classified) >= 2)
+        partials = list(analyzer.analyze_batch_iter(
+            reviews.copy(), chunk_size=7,
+            progress_callback=lambda current, total, status: status.startswith("Classifying") and classified.append(current)
+        ))
+
+        assert [partial["processed"] for partial in partials] == [7, 14, 14]
+        assert [partial["partial"] for partial in partials] == [False, False, True]
+        assert partials[-1]["done"]
+        assert partials[-1]["classification"] == []
+
+    def test_passed_deadline(self, analyzer, reviews):
+        """Test a deadline that passed before the analysis started gives empty partial results"""
+        import time
+
+        results = analyzer.analyze_batch_within(reviews.copy(), deadline=time.time() - 1, chunk_size=7)
+
+        assert results["partial"]
+        assert results["processed_reviews"] == 0
+        assert results["classification"] == []
+        assert results["summary"]["total_reviews"] == 30
+
+    def test_no_deadline_matches_batch(self, analyzer, reviews):
+        """Test analyze_batch_within without running out of time gives the full results"""
+        import time
+
+        expected = analyzer.analyze_batch(reviews.copy())
+        results = analyzer.analyze_batch_within(reviews.copy(), deadline=time.time() + 60, chunk_size=7)
+
+        assert not results["partial"]
+        assert results["processed_reviews"] == 30
+        assert results["classification"] == expected["classification"]
+
+
+class TestBulkAnalysis:
+    """Test analysis of many independent texts"""
+
+    def test_matches_single_reviews(self, blank_analyzer):
+        """Test every text gets the result analyze_single_review gives it"""
+        texts = [
+            "the battery is good. camera is poor!",
+            "ok",
+            "battery and camera are bad. the camera is great"
+        ]
+
+        results = blank_analyzer.analyze_texts(texts, ids=["a", "b", "c"])
+
+        assert [result["id"] for result in results] == ["a", "b", "c"]
+        for text, result in zip(texts, results):
+            expected = blank_analyzer.analyze_single_review(text)
+            expected["id"] = result["id"]
+            assert result == expected
+        assert "error" in results[1]
+
+class TestPredictionCache:
+    """Test the sentence prediction cache"""
+
+    def test_hits_and_misses(self):
+        """Test lookups count hits and misses"""
+        from prediction_cache import PredictionCache
+        cache = PredictionCache(max_size=10, ttl=0)
+        model = object()
+
+        cache.put_many({"battery is good.": "Positive"}, model)
+        found = cache.get_many(["battery is good.", "camera is poor."], model)
+
+        assert found == {"battery is good.": "Positive"}
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+    def test_lru_eviction(self):
+        """Test the least recently used sentence is evicted first"""
+        from prediction_cache import PredictionCache
+        cache = PredictionCache(max_size=2, ttl=0)
+        model = object()
+
+        cache.put_many({"a": "Positive", "b": "Negative"}, model)
+        cache.get_many(["a"], model)
+        cache.put_many({"c": "Positive"}, model)
+
+        assert cache.get_many(["a", "b", "c"], model) == {"a": "Positive", "c": "Positive"}
+        assert cache.stats()["evictions"] == 1
+
+    def test_invalidated_when_model_changes(self):
+        """Test predictions of a reloaded model don't mix with the old model's"""
+        from prediction_cache import PredictionCache
+        cache = PredictionCache(max_size=10, ttl=0)
+        old_model, new_model = object(), object()
+        cache.put_many({"battery is good.": "Positive"}, old_model)
+
+        assert cache.get_many(["battery is good."], new_model) == {}
+        assert cache.stats()["size"] == 0
+
+        # Predictions the old model made while the new one was loaded are never served for it
+        cache.put_many({"camera is poor.": "Negative"}, new_model)
+        cache.put_many({"battery is good.": "Positive"}, old_model)
+        assert cache.get_many(["battery is good.", "camera is poor."], new_model) == {}
+
+    def test_classify_with_cache(self, parsed_df, model):
+        """Test cached classification matches uncached classification"""
+        from classifiation import classify
+        from prediction_cache import PredictionCache
+        features = {"battery": [], "camera": []}
+        cache = PredictionCache(max_size=100, ttl=0)
+
+        expected, _, _ = classify(parsed_df, features, model)
+        first, _, _ = classify(parsed_df, features, model, cache=cache)
+        second, _, _ = classify(parsed_df, features, model, cache=cache)
+
+        assert first.equals(expected)
+        assert second.equals(expected)
+        assert cache.stats()["misses"] == len(expected)
+        assert cache.stats()["hits"] == len(expected)
+
+
+
+def setting_in_worker(name):
+    """Value of a config setting as seen by the process running this"""
+    return getattr(config, name)
+
+
+class TestExecutors:
+    """Test the API's analysis executors"""
+
+    def test_run_in_thread(self):
+        """Test a function runs outside the event loop's thread"""
+        import asyncio
+        import threading
+        import executors
+
+        async def main():
+            return await executors.run_in_thread(lambda: threading.current_thread().name)
+
+        assert asyncio.run(main()).startswith("io")
+
+    def test_process_pool_starts_fresh_interpreters(self, monkeypatch):
+        """Test pool workers are spawned rather than forked from the multi-threaded API process"""
+        import asyncio
+        import os
+        import executors
+        monkeypatch.setattr(config, "API_PROCESS_WORKERS", 1)
+        monkeypatch.setattr(config, "WARMUP_ON_STARTUP", False)
+        monkeypatch.setattr(config, "BATCH_NICENESS", 0)
+        # Only set in this process: a forked worker would inherit it, a spawned one reads config again
+        monkeypatch.setattr(config, "MICROBATCH_MAX_SIZE", -1)
+
+        async def main():
+            return await executors.run_in_process(setting_in_worker, "MICROBATCH_MAX_SIZE")
+
+        try:
+            assert asyncio.run(main()) == int(os.getenv("MICROBATCH_MAX_SIZE", "64"))
+        finally:
+            executors.shutdown()
+
+    def test_scheduler_weighted_fair_queuing(self):
+        """Test shared threads serve the waiting classes in proportion to their weights"""
+        import threading
+        from executors import PriorityScheduler
+        scheduler = PriorityScheduler({"single": (3, 0), "batch": (1, 0)}, shared_workers=1)
+        started = threading.Event()
+        gate = threading.Event()
+        order = []
+
+        blocker = scheduler.submit("batch", lambda: started.set() or gate.wait())
+        started.wait(5)
+        futures = [scheduler.submit("batch", lambda: order.append("batch")) for _ in range(4)]
+        futures += [scheduler.submit("single", lambda: order.append("single")) for _ in range(4)]
+        assert scheduler.stats()["single"] == {"queued": 4, "running": 0}
+        gate.set()
+        for future in [blocker] + futures:
+            future.result(timeout=5)
+        scheduler.shutdown()
+
+        assert order == ["single"] * 4 + ["batch"] * 4
+
+    def test_scheduler_dedicated_threads(self):
+        """Test a class with dedicated threads is served while the shared threads are busy"""
+        import threading
+        from executors import PriorityScheduler
+        scheduler = PriorityScheduler({"single": (1, 1), "batch": (1, 0)}, shared_workers=1)
+        started = threading.Event()
+        gate = threading.Event()
+
+        blocker = scheduler.submit("batch", lambda: (started.set(), gate.wait()))
+        try:
+            # Only once the shared thread is busy, otherwise it could take the next call itself
+            assert started.wait(timeout=5)
+            assert scheduler.submit("single", lambda: threading.current_thread().name).result(timeout=5) == "analysis-single-0"
+            assert not blocker.done()
+        finally:
+            gate.set()
+            scheduler.shutdown()
+
+    def test_limiter_caps_concurrency(self):
+        """Test no more than `limit` requests are analyzed at once"""
+        import asyncio
+        from executors import ConcurrencyLimiter
+        limiter = ConcurrencyLimiter("test", 2)
+        peak = []
+
+        async def request():
+            async with limiter:
+                peak.append(limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*[request() for _ in range(6)])
+
+        asyncio.run(main())
+
+        assert max(peak) == 2
+        assert limiter.stats() == {"limit": 2, "in_flight": 0, "waiting": 0, "completed": 6}
+
+
+class TestMicroBatcher:
+    """Test coalescing of concurrent requests"""
+
+    def test_concurrent_items_share_a_batch(self):
+        """Test items submitted together run as one batch and each caller gets its own result"""
+        import asyncio
+        from microbatch import MicroBatcher
+        batches = []
+
+        def process_batch(items):
+            batches.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(process_batch, max_batch_size=4, max_wait_ms=50)
+
+        async def main():
+            return await asyncio.gather(*[batcher.submit(i) for i in range(6)])
+
+        assert asyncio.run(main()) == [0, 2, 4, 6, 8, 10]
+        # Nothing arrived before the first item, so it didn't wait for others
+        assert batches == [[0], [1, 2, 3, 4], [5]]
+        assert batcher.stats()["mean_batch_size"] == 2.0
+
+    def test_errors_reach_every_caller(self):
+        """Test a failing batch raises in each of its callers"""
+        import asyncio
+        from microbatch import MicroBatcher
+
+        def process_batch(items):
+            raise ValueError("model failed")
+
+        batcher = MicroBatcher(process_batch, max_batch_size=4, max_wait_ms=5)
+
+        async def main():
+            return await asyncio.gather(*[batcher.submit(i) for i in range(2)], return_exceptions=True)
+
+        results = asyncio.run(main())
+        assert all(isinstance(result, ValueError) for result in results)
+
+
+class TestSingleFlight:
+    """Test sharing of analyses between identical concurrent requests"""
+
+    def test_identical_calls_share_one_run(self):
+        """Test concurrent calls with the same key run once and all get the result"""
+        import asyncio
+        from singleflight import SingleFlight, content_key
+        flight = SingleFlight("test")
+        runs = []
+
+        async def analyze(text):
+            runs.append(text)
+            await asyncio.sleep(0.01)
+            return {"text": text}
+
+        async def main():
+            calls = [flight.run(content_key(text, "logistic_regression"), lambda text=text: analyze(text))
+                     for text in ["good", "good", "bad", "good"]]
+            return await asyncio.gather(*calls)
+
+        results = asyncio.run(main())
+
+        assert sorted(runs) == ["bad", "good"]
+        assert [result["text"] for result in results] == ["good", "good", "bad", "good"]
+        assert flight.in_flight() == 0
+
+    def test_errors_reach_every_caller(self):
+        """Test every caller sharing a failed run gets its exception"""
+        import asyncio
+        from singleflight import SingleFlight
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("model not loaded")
+
+        async def main():
+            flight = SingleFlight("test")
+            return await asyncio.gather(flight.run("key", fail), flight.run("key", fail), return_exceptions=True)
+
+        assert [str(result) for result in asyncio.run(main())] == ["model not loaded"] * 2
+
+    def test_file_digest_rewinds(self):
+        """Test hashing an upload leaves it readable from the start"""
+        import io
+        from singleflight import file_digest
+        upload = io.BytesIO(b"great phone,5\n")
+
+        assert file_digest(upload, block_size=4) == file_digest(io.BytesIO(b"great phone,5\n"))
+        assert upload.read() == b"great phone,5\n"
+
+
+class TestResponses:
+    """Test response encoding and field projection"""
+
+    def test_project(self):
+        """Test paths select nested keys, every key with * and into the items of lists"""
+        from responses import project
+        content = {
+            "summary": {"total_sentences": 2},
+            "features": {"camera": {"related": ["lens"], "total": 2}, "battery": {"related": [], "total": 1}},
+            "classification": [{"category": "camera", "sentence": "camera is poor", "sentiment": "Negative"}]
+        }
+
+        assert project(content, None) is content
+        assert project(content, ["summary", "features.*.total", "classification.sentiment"]) == {
+            "summary": {"total_sentences": 2},
+            "features": {"camera": {"total": 2}, "battery": {"total": 1}},
+            "classification": [{"sentiment": "Negative"}]
+        }
+        assert project(content, ["features.camera"]) == {"features": {"camera": content["features"]["camera"]}}
+        assert project(content, ["features.*.total", "features.camera.related"]) == {
+            "features": {"camera": {"related": ["lens"], "total": 2}, "battery": {"total": 1}}
+        }
+        assert project(content, ["features.*.total", "features.camera"]) == {
+            "features": {"camera": content["features"]["camera"], "battery": {"total": 1}}
+        }
+
+    def test_parse_fields(self):
+        """Test fields are split on commas and unknown top-level fields are rejected"""
+        from responses import parse_fields
+
+        assert parse_fields(None, ["summary"]) is None
+        assert parse_fields("summary, features.*.total,", ["summary", "features"]) == ["summary", "features.*.total"]
+        with pytest.raises(ValueError, match="scores"):
+            parse_fields("summary,scores", ["summary", "features"])
+
+    def test_dumps_numpy(self):
+        """Test numpy values in results are encoded like Python ones"""
+        import json
+        import numpy as np
+        from responses import dumps
+
+        assert json.loads(dumps({"count": np.int64(3), "scores": np.array([0.5, 1.0])})) == {"count": 3, "scores": [0.5, 1.0]}
+
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    def test_dumps_non_string_keys(self, use_orjson, monkeypatch):
+        """Test int and numpy dict keys are encoded as strings, with and without orjson"""
+        import json
+        import numpy as np
+        import responses
+        if use_orjson and not responses.ORJSON_AVAILABLE:
+            pytest.skip("orjson not installed")
+        monkeypatch.setattr(responses, "ORJSON_AVAILABLE", use_orjson)
+
+        content = {5: 2, "ratings": [{np.int64(4): 3, np.float64(1.5): 1}]}
+
+        assert json.loads(responses.dumps(content)) == {"5": 2, "ratings": [{"4": 3, "1.5": 1}]}
+
+
+class TestApi:
+    """Test API endpoints"""
+
+    @pytest.fixture
+    def client(self, blank_analyzer, monkeypatch):
+        """Test client whose endpoints use the blank analyzer"""
+        pytest.importorskip("httpx")
+        from fastapi.testclient import TestClient
+        import analyzer
+        import api
+
+        # Spawned pool workers would load the full models instead of the blank analyzer
+        monkeypatch.setattr(config, "API_PROCESS_WORKERS", 0)
+        monkeypatch.setattr(analyzer, "_default_analyzer", blank_analyzer)
+        return TestClient(api.app)
+
+    def test_batch_stream(self, client, monkeypatch):
+        """Test streamed batch results end with the summary of every row"""
+        import json
+        monkeypatch.setattr(config, "STREAM_CHUNK_SIZE", 4)
+        csv = "the battery is good. camera is poor!,5\nnice phone with a good camera,4\n" * 5
+
+        response = client.post(
+            "/analyze/batch", files={"file": ("reviews.csv", csv, "text/csv")},
+            headers={"Accept": "application/x-ndjson"}
+        )
+
+        assert response.headers["content-type"] == "application/x-ndjson"
+        records = [json.loads(line) for line in response.text.splitlines()]
+        rows = [record for record in records if record["type"] == "row"]
+        progress = [record["processed"] for record in records if record["type"] == "progress"]
+
+        assert progress == [4, 8, 10]
+        assert records[-1]["type"] == "summary"
+        assert records[-1]["summary"]["total_sentences"] == len(rows) == 15
+        assert records[-1]["summary"]["total_reviews"] == 10
+        # The stream gave its admission slot back
+        import admission
+        assert admission.controller.outstanding["batch"] == 0
+
+    def test_fields(self, client):
+        """Test fields= limits the response and unknown fields are rejected"""
+        csv = "the battery is good. camera is poor!,5\nnice phone with a good camera,4\n" * 5
+        upload = {"file": ("reviews.csv", csv, "text/csv")}
+
+        full = client.post("/analyze/batch", files=upload).json()
+        projected = client.post("/analyze/batch", params={"fields": "summary,features.*.total"}, files=upload).json()
+        single = client.post("/analyze/single", json={"text": "the battery is good. camera is poor!"})
+
+        assert list(full) == ["summary", "features", "classification", "partial", "processed_reviews"]
+        assert full["features"]
+        assert projected == {
+            "summary": full["summary"],
+            "features": {feature: {"total": counts["total"]} for feature, counts in full["features"].items()}
+        }
+        # Keys of the results that aren't in the response model are still left out
+        assert "overall_sentiment" not in single.json()
+        assert client.post("/analyze/single", params={"fields": "summary,scores"}, json={"text": "nice phone"}).status_code == 400
+
+    def test_batch_stream_matches_batch(self, client, monkeypatch):
+        """Test a batch over SMALL_BATCH_MAX_REVIEWS gives the same results streamed and not streamed"""
+        import json
+        monkeypatch.setattr(config, "STREAM_CHUNK_SIZE", 16)
+        stand_in_feature_extraction(monkeypatch)
+        csv = "the battery is good. camera is poor!,5\nnice phone with a good camera,4\n" * 40
+        upload = {"file": ("reviews.csv", csv, "text/csv")}
+
+        expected = client.post("/analyze/batch", files=upload).json()
+        records = [json.loads(line) for line in client.post("/analyze/batch", params={"stream": True}, files=upload).text.splitlines()]
+
+        rows = [{key: record[key] for key in ["category", "sentence", "sentiment"]} for record in records if record["type"] == "row"]
+        assert rows == expected["classification"]
+        assert records[-1]["features"] == expected["features"]
+        assert records[-1]["summary"] == expected["summary"]
+
+    def test_batch_admission_is_atomic(self, monkeypatch):
+        """Test concurrent batch uploads beyond the budget get 429 while the first is being analyzed"""
+        import asyncio
+        import httpx
+        import admission
+        import api
+        monkeypatch.setattr(admission.controller, "budgets", dict(admission.controller.budgets, batch=1))
+
+        async def slow_analysis(df, model_type, deadline):
+            await release.wait()
+            return {"summary": {}, "features": {}, "classification": []}
+
+        monkeypatch.setattr(api, "_analyze_batch", slow_analysis)
+
+        async def main():
+            nonlocal release
+            release = asyncio.Event()
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                def upload():
+                    return http.post("/analyze/batch", files={"file": ("reviews.csv", "nice phone,5\n", "text/csv")})
+
+                first = asyncio.ensure_future(upload())
+                while admission.controller.outstanding["batch"] == 0:
+                    await asyncio.sleep(0.01)
+                others = await asyncio.gather(*[upload() for _ in range(5)])
+                release.set()
+                return (await first).status_code, [response.status_code for response in others]
+
+        release = None
+        first, others = asyncio.run(asyncio.wait_for(main(), timeout=30))
+
+        assert first == 200
+        assert others == [429] * 5
+        assert admission.controller.outstanding["batch"] == 0
+
+    def test_identical_uploads_parsed_once(self, monkeypatch):
+        """Test identical batch uploads share one analysis and only the first one's CSV is parsed"""
+        import asyncio
+        import httpx
+        import api
+        import executors
+        import metrics
+        monkeypatch.setattr(config, "SINGLEFLIGHT_ENABLED", True)
+        followers = metrics.SINGLEFLIGHT_REQUESTS.value(group="batch", role="follower")
+        parsed = []
+        original = utils.read_reviews_csv
+
+        def read_reviews_csv(file):
+            parsed.append(file)
+            return original(file)
+
+        async def slow_analysis(func, df, model_type, deadline):
+            await release.wait()
+            return {"summary": {}, "features": {}, "classification": []}
+
+        monkeypatch.setattr(utils, "read_reviews_csv", read_reviews_csv)
+        monkeypatch.setattr(executors, "run_in_process", slow_analysis)
+
+        async def main():
+            nonlocal release
+            release = asyncio.Event()
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                def upload():
+                    return http.post("/analyze/batch", files={"file": ("reviews.csv", "nice phone,5\n", "text/csv")})
+
+                first = asyncio.ensure_future(upload())
+                while not parsed:
+                    await asyncio.sleep(0.01)
+                second = asyncio.ensure_future(upload())
+                while metrics.SINGLEFLIGHT_REQUESTS.value(group="batch", role="follower") == followers:
+                    await asyncio.sleep(0.01)
+                release.set()
+                return [response.status_code for response in await asyncio.gather(first, second)]
+
+        release = None
+        statuses = asyncio.run(asyncio.wait_for(main(), timeout=30))
+
+        assert statuses == [200, 200]
+        assert len(parsed) == 1
+
+    def test_websocket_admission(self, client, monkeypatch):
+        """Test WebSocket reviews count against the single budget"""
+        import admission
+        monkeypatch.setattr(admission.controller, "budgets", dict(admission.controller.budgets, single=1))
+
+        with admission.controller.track("single"):
+            with client.websocket_connect("/ws/analyze") as websocket:
+                websocket.send_json({"id": 1, "text": "nice phone with a good camera"})
+                reply = websocket.receive_json()
+
+        assert reply["id"] == 1
+        assert "Too many single requests" in reply["error"]
+
+    def test_websocket_stream(self, client):
+        """Test reviews sent over the WebSocket are answered in order, invalid ones with an error"""
+        with client.websocket_connect("/ws/analyze") as websocket:
+            websocket.send_json({"id": 1, "text": "the battery is good. camera is poor!"})
+            websocket.send_text("not json")
+            websocket.send_json({"id": 3, "text": "nice phone with a good camera"})
+            replies = [websocket.receive_json() for _ in range(3)]
+
+        assert [reply["id"] for reply in replies] == [1, None, 3]
+        assert "error" in replies[1]
+        assert len(replies[0]["result"]["classification"]) == 2
+        assert replies[2]["result"]["original_text"] == "nice phone with a good camera"
+
+    def test_ready_after_warmup(self, client, blank_analyzer, monkeypatch, tmp_path):
+        """Test /ready fails until the startup warmup is done and /health reports the loaded models"""
+        import time
+        from fastapi.testclient import TestClient
+        import api
+        import jobs
+        monkeypatch.setattr(config, "API_PROCESS_WORKERS", 0)
+        monkeypatch.setattr(api, "warmup_state", {"status": "pending", "seconds": None, "error": None})
+        monkeypatch.setattr(jobs, "queue", jobs.JobQueue(tmp_path / "jobs.db", tmp_path / "jobs", workers=0))
+
+        # Without the lifespan no warmup has run
+        assert client.get("/ready").status_code == 503
+        assert client.get("/health").json()["status"] == "starting"
+
+        with TestClient(api.app) as started:
+            deadline = time.time() + 30
+            while started.get("/ready").status_code != 200 and time.time() < deadline:
+                time.sleep(0.05)
+            health = started.get("/health").json()
+
+        assert blank_analyzer.warmed_up
+        assert health["status"] == "healthy" and health["ready"]
+        assert health["models_loaded"]["logistic_regression"]
+        assert not health["models_loaded"]["fasttext"]
+
+
+class TestBodySizeLimit:
+    """Test the request body size limit"""
+
+    def send_request(self, headers, chunks):
+        """Send a request with the given body chunks through the middleware and return (status, body read by the app)"""
+        import asyncio
+        from middleware import BodySizeLimitMiddleware
+        read = []
+        sent = []
+
+        async def app(scope, receive, send):
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    raise ConnectionError("client disconnected")
+                read.append(message["body"])
+                if not message.get("more_body"):
+                    break
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        messages = [
+            {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+            for i, chunk in enumerate(chunks)
+        ]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "headers": headers}
+        asyncio.run(BodySizeLimitMiddleware(app, max_bytes=10)(scope, receive, send))
+        return sent[0]["status"], b"".join(read)
+
+    def test_small_body_passes(self):
+        """Test bodies within the limit reach the app"""
+        assert self.send_request([(b"content-length", b"8")], [b"1234", b"5678"]) == (200, b"12345678")
+
+    def test_declared_length_rejected_before_reading(self):
+        """Test a Content-Length over the limit is rejected without reading the body"""
+        assert self.send_request([(b"content-length", b"11")], [b"12345678901"]) == (413, b"")
+
+    def test_streamed_body_cut_off(self):
+        """Test a body without Content-Length is cut off once it goes over the limit"""
+        status, read = self.send_request([], [b"123456", b"789012", b"345678"])
+
+        assert status == 413
+        assert read == b"123456"
+
+
+class TestMetrics:
+    """Test metrics collection and exposition"""
+
+    def test_histogram_exposition(self):
+        """Test histogram buckets are cumulative and end with +Inf, sum and count"""
+        from metrics import Histogram
+        histogram = Histogram("test_latency_seconds", "Test latency", ("stage",), buckets=(0.1, 1.0))
+
+        for value in [0.05, 0.5, 5.0]:
+            histogram.observe(value, stage="parse")
+
+        assert histogram.samples() == [
+            'test_latency_seconds_bucket{stage="parse",le="0.1"} 1',
+            'test_latency_seconds_bucket{stage="parse",le="1"} 2',
+            'test_latency_seconds_bucket{stage="parse",le="+Inf"} 3',
+            'test_latency_seconds_sum{stage="parse"} 5.55',
+            'test_latency_seconds_count{stage="parse"} 3'
+        ]
+
+    def test_capture_and_replay(self):
+        """Test updates captured in one registry can be applied again, as done for pool workers"""
+        from metrics import Counter, capture, replay
+        counter = Counter("test_lookups_total", "Test lookups", ("result",))
+
+        with capture() as updates:
+            counter.inc(3, result="hit")
+        replay(updates)
+
+        assert updates == [("test_lookups_total", "inc", {"result": "hit"}, 3)]
+        assert counter.value(result="hit") == 6
+
+    def test_workers_merged(self, tmp_path, monkeypatch):
+        """Test pre-fork workers sharing a directory show their totals, and an exited worker keeps its counts"""
+        import json
+        import os
+        import metrics
+        from metrics import Counter, Gauge, Histogram
+        counter = Counter("test_shared_total", "Test requests", ("path",))
+        gauge = Gauge("test_shared_load_seconds", "Test load time", aggregate="max")
+        histogram = Histogram("test_shared_seconds", "Test latency", buckets=(1.0,))
+        counter.inc(2, path="/analyze")
+        gauge.set(3.0)
+        histogram.observe(0.5)
+        (tmp_path / "999.json").write_text(json.dumps({
+            "test_shared_total": [[["/analyze"], 5]],
+            "test_shared_load_seconds": [[[], 7.0]],
+            "test_shared_seconds": [[[], [0, 1, 2.0]]]
+        }))
+        monkeypatch.setattr(metrics, "_directory", None)
+
+        metrics.share(tmp_path, interval=3600)
+        values = metrics.collect()
+
+        assert (tmp_path / f"{os.getpid()}.json").exists()
+        assert values["test_shared_total"] == {("/analyze",): 7}
+        assert values["test_shared_load_seconds"] == {(): 7.0}
+        assert histogram.samples(values["test_shared_seconds"]) == [
+            'test_shared_seconds_bucket{le="1"} 1',
+            'test_shared_seconds_bucket{le="+Inf"} 2',
+            'test_shared_seconds_sum 2.5',
+            'test_shared_seconds_count 2'
+        ]
+
+        metrics.mark_process_dead(999, tmp_path)
+        values = metrics.collect()
+
+        assert values["test_shared_total"] == {("/analyze",): 7}
+        assert values["test_shared_load_seconds"] == {(): 3.0}
+
+    def test_metrics_endpoint(self, blank_analyzer, monkeypatch):
+        """Test requests and analysis stages show up on /metrics"""
+        pytest.importorskip("httpx")
+        from fastapi.testclient import TestClient
+        import analyzer
+        import api
+        monkeypatch.setattr(config, "API_PROCESS_WORKERS", 0)
+        monkeypatch.setattr(analyzer, "_default_analyzer", blank_analyzer)
+        client = TestClient(api.app)
+
+        client.post("/analyze/bulk", json={"texts": ["the battery is good. camera is poor!"]})
+        text = client.get("/metrics").text
+
+        assert 'sentiment_requests_total{method="POST",path="/analyze/bulk",status="200"}' in text
+        assert 'sentiment_stage_seconds_count{stage="classify"}' in text
+
+
+class TestAdmission:
+    """Test admission control"""
+
+    def test_budget_exceeded(self):
+        """Test requests beyond a group's budget get 429 with Retry-After"""
+        from fastapi import HTTPException
+        from admission import AdmissionController
+        controller = AdmissionController({"batch": 1, "single": 0}, max_rss_mb=0, retry_after=7)
+
+        with controller.track("batch"):
+            with pytest.raises(HTTPException) as error:
+                controller.check("batch")
+            # Budget 0 means unlimited
+            controller.check("single")
+
+        assert error.value.status_code == 429
+        assert error.value.headers["Retry-After"] == "7"
+        controller.check("batch")
+        assert controller.queue_depth()["batch"] == {"outstanding": 0, "budget": 1}
+
+    def test_memory_limit(self):
+        """Test requests are rejected with 503 while the process is over the memory limit"""
+        from fastapi import HTTPException
+        from admission import AdmissionController, resident_memory_mb
+        if resident_memory_mb() is None:
+            pytest.skip("/proc is not available")
+        controller = AdmissionController({"single": 0}, max_rss_mb=1)
+
+        with pytest.raises(HTTPException) as error:
+            controller.check("single")
+
+        assert error.value.status_code == 503
+        assert "Retry-After" in error.value.headers
+
+
+class TestJobs:
+    """Test the batch job queue"""
+
+    @pytest.fixture
+    def queue(self, tmp_path, monkeypatch):
+        from jobs import JobQueue
+        monkeypatch.setattr(config, "JOB_HEARTBEAT_SECONDS", 0.1)
+        monkeypatch.setattr(config, "WARMUP_ON_STARTUP", False)
+        # Forked, so the job processes get the test's analyzer
+        return JobQueue(tmp_path / "jobs.db", tmp_path / "jobs", workers=1, start_method="fork")
+
+    def test_job_completes(self, queue, blank_analyzer, monkeypatch):
+        """Test a submitted job runs in the background and stores its result"""
+        import io
+        import json
+        import time
+        import analyzer
+        import jobs
+        monkeypatch.setattr(analyzer, "_default_analyzer", blank_analyzer)
+        csv = b"the battery is good. camera is poor!,5\nnice phone with a good camera,4\n"
+
+        job = queue.submit(io.BytesIO(csv), "logistic_regression")
+        assert job["status"] == jobs.QUEUED
+        queue.start()
+        try:
+            deadline = time.time() + 60
+            while queue.get(job["id"])["status"] not in jobs.FINISHED and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            queue.stop()
+
+        job = queue.get(job["id"])
+        assert job["status"] == jobs.COMPLETED, job["error"]
+        assert job["progress"] == 1.0
+        with open(queue.result_path(job["id"])) as f:
+            assert json.load(f)["summary"]["total_sentences"] == 3
+
+    def test_timeout(self, queue, monkeypatch):
+        """Test a job process that doesn't finish in time is stopped and its job failed"""
+        import io
+        import time
+        import jobs
+        monkeypatch.setattr(config, "JOB_TIMEOUT_SECONDS", 0.5)
+        monkeypatch.setattr(jobs, "execute_job", lambda *args: time.sleep(60))
+
+        job = queue.submit(io.BytesIO(b"good phone,5\n"), "logistic_regression")
+        queue.start()
+        try:
+            deadline = time.time() + 30
+            while queue.get(job["id"])["status"] not in jobs.FINISHED and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            queue.stop()
+
+        job = queue.get(job["id"])
+        assert job["status"] == jobs.FAILED
+        assert "did not finish" in job["error"]
+
+    def test_job_process_runs_every_job(self, tmp_path, monkeypatch):
+        """Test jobs run one after the other in a job process started the default way (spawned)"""
+        import io
+        import time
+        import jobs
+        monkeypatch.setattr(config, "JOB_HEARTBEAT_SECONDS", 0.1)
+        monkeypatch.setattr(config, "WARMUP_ON_STARTUP", False)
+        queue = jobs.JobQueue(tmp_path / "jobs.db", tmp_path / "jobs", workers=1)
+
+        submitted = [queue.submit(io.BytesIO(b""), "logistic_regression") for _ in range(2)]
+        queue.start()
+        try:
+            deadline = time.time() + 120
+            while any(queue.get(job["id"])["status"] not in jobs.FINISHED for job in submitted) and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            queue.stop()
+
+        for job in submitted:
+            job = queue.get(job["id"])
+            assert job["status"] == jobs.FAILED
+            assert job["error"] == "CSV file is empty"
+        assert queue.processes_started == 1
+
+    def test_cancel_and_requeue(self, queue, monkeypatch):
+        """Test queued jobs are cancelled right away and running jobs without a heartbeat are requeued"""
+        import io
+        import jobs
+        first = queue.submit(io.BytesIO(b"good phone,5\n"), "logistic_regression")
+        second = queue.submit(io.BytesIO(b"bad phone,1\n"), "logistic_regression")
+
+        assert queue.cancel(first["id"])["status"] == jobs.CANCELLED
+        assert queue.claim()["id"] == second["id"]
+        assert queue.get(second["id"])["status"] == jobs.RUNNING
+
+        monkeypatch.setattr(config, "JOB_STALE_SECONDS", -1)
+        assert queue.requeue_stale() == 1
+        assert queue.get(second["id"])["status"] == jobs.QUEUED
+
+
+class TestServer:
+    """Test the pre-fork server"""
+
+    def test_bind_socket(self):
+        """Test the shared socket listens and is inherited by forked workers"""
+        import socket
+        from server import bind_socket
+        sock = bind_socket("127.0.0.1", 0)
+        try:
+            assert sock.get_inheritable()
+            client = socket.create_connection(sock.getsockname(), timeout=5)
+            client.close()
+        finally:
+            sock.close()
+
 class TestConfig:
     """Test configuration"""
     
@@ -15,8 +15,10 @@ from sklearn.ensemble import RandomForestClassifier
 
 from joblib import dump, load
 
+import config
 import constants
 from feature_extraction import feature_extraction
+from preprocess import pipe_settings
 
 # contains mapping such as "don't" => "do not"
 appos = constants.appos
@@ -33,8 +35,7 @@ def preprocess(txt, nlp):
 	txt = txt.lower() # converting text to lower case
 	txt = reduce_lengthening(txt) # normalizing exaggerated words
 	
-	with nlp.disable_pipes('tagger', 'parser', 'ner'):
-		doc = nlp(txt) # tokenizing the words
+	doc = nlp(txt, disable=['tagger', 'parser', 'ner']) # tokenizing the words
 	
 	tokens = [token.text for token in doc]
 	
@@ -58,8 +59,7 @@ def preprocess(txt, nlp):
 
 def postprocess(x, nlp):
 	# removing stop words
-	with nlp.disable_pipes(['tagger', 'parser', 'ner', 'sentencizer']):
-		doc = nlp(x)
+	doc = nlp(x, disable=['tagger', 'parser', 'ner', 'sentencizer'])
 	
 	words = [token.text for token in doc if token.text not in stopwords]
 	x = ' '.join(words)
@@ -68,11 +68,13 @@ def postprocess(x, nlp):
 	
 	return x
 
-def construct_spacy_obj(df, nlp):
-	with nlp.disable_pipes(['parser', 'ner', 'sentencizer']):
-		# constructing spacy object for each review
-		docs = list(nlp.pipe(df['reviewText']))
-		df['spacyObj'] = pd.Series(docs, index=df['reviewText'].index)
+def construct_spacy_obj(df, nlp, n_process=None, batch_size=None):
+	# Training runs on its own, so it may fan out across every core
+	n_process, batch_size = pipe_settings(df['reviewText'], n_process, batch_size, config.SPACY_TRAIN_N_PROCESS)
+
+	# constructing spacy object for each review
+	docs = list(nlp.pipe(df['reviewText'], disable=['parser', 'ner', 'sentencizer'], n_process=n_process, batch_size=batch_size))
+	df['spacyObj'] = pd.Series(docs, index=df['reviewText'].index)
 	
 	return df
 
@@ -111,21 +113,50 @@ def giveRating(x):
 	elif x in [1,2,3]:
 		return "Negative"
 
+def load_training_data(nlp):
+	train_data = pd.read_csv(config.TRAINING_DATA, header=None, names=['reviewText', 'rating'])
+	train_data.dropna(inplace=True)
+	train_data['reviewText'] = train_data['reviewText'].apply(lambda x: preprocess(x, nlp))
+	train_data.dropna(inplace=True)
+	train_data = construct_spacy_obj(train_data, nlp)
+
+	return train_data
+
+def get_taxonomy(nlp, ft_model):
+	# The taxonomy is the feature bucket mapping extracted once from the whole training corpus.
+	# It is used as the feature lookup for inputs too small to extract features from.
+	# A taxonomy older than the trained model is rebuilt, as the model was retrained since.
+	if os.path.isfile(config.TAXONOMY_PATH):
+		if not taxonomy_is_stale():
+			print("Aspect taxonomy found. Using it.")
+			return load(config.TAXONOMY_PATH)
+		print("Aspect taxonomy is older than the trained model.")
+
+	if not os.path.isfile(config.TRAINING_DATA):
+		print("Aspect taxonomy not found and no training corpus to build it from.")
+		return None
+
+	print("Building the aspect taxonomy from the training corpus!")
+	features = feature_extraction(load_training_data(nlp), ft_model, nlp)
+	dump(features, config.TAXONOMY_PATH)
+
+	return features
+
+def taxonomy_is_stale():
+	# The taxonomy is saved right after the model it was trained with
+	return os.path.isfile(config.MODEL_PATH) and os.path.getmtime(config.TAXONOMY_PATH) < os.path.getmtime(config.MODEL_PATH)
+
 def get_model(nlp, ft_model):
 
-	if os.path.isfile('models/model.joblib'):
+	if os.path.isfile(config.MODEL_PATH):
 		print("Trained model found. Using them.")
-		model = load('models/model.joblib')
+		model = load(config.MODEL_PATH)
 		# tfidf = load('models/tfidf.joblib')
 
 	else:
 		print("Trained models not found. Training now!")
 
-		train_data = pd.read_csv('csv_files/training.csv', header=None, names=['reviewText', 'rating'])
-		train_data.dropna(inplace=True)
-		train_data['reviewText'] = train_data['reviewText'].apply(lambda x: preprocess(x, nlp))
-		train_data.dropna(inplace=True)
-		train_data = construct_spacy_obj(train_data, nlp)
+		train_data = load_training_data(nlp)
 
 		features = feature_extraction(train_data, ft_model, nlp)
 
@@ -158,7 +189,9 @@ def get_model(nlp, ft_model):
 		final_lr.fit(X_train, y_train)
 		# final_rf.fit(X_train, y_train)
 
-		dump(final_lr, 'models/model.joblib')
+		dump(final_lr, config.MODEL_PATH)
+		# After the model, so the taxonomy isn't taken for an older one (see get_taxonomy)
+		dump(features, config.TAXONOMY_PATH)
 		# dump(final_rf, 'models/model_rf.joblib')
 		# dump(tfidf, 'tfidf.joblib')
 
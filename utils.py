@@ -42,6 +42,23 @@ def validate_csv_file(file) -> Tuple[bool, str, Optional[pd.DataFrame]]:
         return False, f"Error reading CSV: {str(e)}", None
 
 
+def read_reviews_csv(file) -> pd.DataFrame:
+    """
+    Read a reviews CSV
+    
+    The file is parsed straight from the path or file object (e.g. a spooled
+    upload) without reading its raw bytes into a string first. The whole
+    DataFrame is held in memory, the analysis chunks it afterwards.
+    
+    Args:
+        file: Path or file object of a CSV file with reviewText and rating columns
+        
+    Returns:
+        DataFrame with 'reviewText' and 'rating' columns
+    """
+    return pd.read_csv(file, header=None, names=['reviewText', 'rating'])
+
+
 def validate_single_review(text: str) -> Tuple[bool, str]:
     """
     Validate single review text